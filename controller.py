@@ -1,79 +1,166 @@
 """
 Orchestrates the genetic algorithm, supporting future MVC structure.
+
+Run from the repository root:
+    python controller.py --target ./majesticUnicorn_smoll.png --generations 500
+    python controller.py --headless --output ./out --seed 1
+    python controller.py --help
 """
 
-import subprocess
+import argparse
+import contextlib
 import os
-import matplotlib.pyplot as plt
+import random
+import shutil
+import subprocess
+import sys
 
-def plot(gen_alg):
+def plot(gen_alg, path=None, show=True, max_points=None):
+    """
+    Plots fitness over the generations.
+
+    Args:
+        gen_alg: A finished version 1 or version 2 GeneticAlgorithm.
+        path (str): File the plot is saved to, if given.
+        show (bool): Whether to open a window with the plot.
+        max_points (int): Plot at most this many evenly spaced generations (version 2).
+    """
+    import matplotlib # imported here so runs that do not plot never load it
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
     # add other metrics (individual fitness, average fitness, etc)
-    x_axis, max_fitness_data, min_fitness_data, avg_fitness_data = [], [], [], []
-
-    for gen in range(gen_alg.num_generations):
-        for ind in range(gen_alg.population_size):
-            fitnesses = [ind.fitness for ind in gen_alg.generations[gen].population]
-            max_fit = max(fitnesses)
-            min_fit = min(fitnesses)
-            avg_fit = sum(fitnesses) / gen_alg.population_size
-            x_axis.append(gen)
-            max_fitness_data.append(max_fit)
-            min_fitness_data.append(min_fit)
-            avg_fitness_data.append(avg_fit)
+    if hasattr(gen_alg, "stats"):
+        rows = gen_alg.stats.decimate(max_points)
+        x_axis = rows.generation
+        max_fitness_data = rows.max_fitness
+        min_fitness_data = rows.min_fitness
+        avg_fitness_data = rows.mean_fitness
+        # sampled candidate scores are not comparable with full-resolution ones
+        suffix = " (sampled)" if rows.sampled.any() else ""
+    else: # version 1
+        x_axis = list(range(1, len(gen_alg.max_fitness_data) + 1))
+        max_fitness_data = gen_alg.max_fitness_data
+        min_fitness_data = gen_alg.min_fitness_data
+        avg_fitness_data = gen_alg.avg_fitness_data
+        suffix = ""
 
     fig, ax = plt.subplots()
     ax.set_xlabel("Generation")
     ax.set_ylabel("Fitness")
     ax.set_title("Fitness Over Generations")
-    ax.plot(x_axis, max_fitness_data, "r-", label="Max Fitness")
-    ax.plot(x_axis, min_fitness_data, "g-", label="Min Fitness")
-    ax.plot(x_axis, avg_fitness_data, "b-", label="Avg Fitness")
+    ax.plot(x_axis, max_fitness_data, "r-", label="Max Fitness" + suffix)
+    ax.plot(x_axis, min_fitness_data, "g-", label="Min Fitness" + suffix)
+    ax.plot(x_axis, avg_fitness_data, "b-", label="Avg Fitness" + suffix)
     ax.legend()
-    plt.show()
-
-if __name__ == "__main__":
+    if path:
+        fig.savefig(path)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+@contextlib.contextmanager
+def power_hooks(enabled):
     """
-    Runs the genetic algorithm.
-    
-    Saves files and displays the fitness plot.
+    Keeps a Mac awake during the run (caffeinate) and starts the screen
+    saver, then puts the display to sleep when the run ends. Does nothing
+    unless enabled, or on other platforms.
     """
-
-    caffeinate = subprocess.Popen(['caffeinate', '-i'])
-    os.system("open -a ScreenSaverEngine")
-
+    if not enabled or sys.platform != "darwin" or not shutil.which("caffeinate"):
+        if enabled:
+            print("Power hooks are only available on macOS; continuing without them")
+        yield
+        return
+
+    caffeinate = subprocess.Popen(["caffeinate", "-i"])
+    subprocess.run(["open", "-a", "ScreenSaverEngine"])
     try:
-        METHOD = "V2"
-
-        if METHOD == "V1":
-            from version_1.genetic_algorithm import GeneticAlgorithm
-            from version_1.image_renderer import ImageRenderer
-
-            renderer = ImageRenderer()
-            target = renderer.load_image("./simplest_smoll.png")
-            # target = renderer.load_image("./simple_smoll.png")
-            # target = renderer.load_image("./majesticUnicorn_smoll.png")
-
-            gen_alg = GeneticAlgorithm(target)
-            gen_alg.evolve()
-            plot(gen_alg)
-
-        elif METHOD == "V2":
-            from version_2.genetic_algorithm import GeneticAlgorithm
-            from version_2.image_renderer import ImageRenderer
+        yield
+    finally:
+        caffeinate.terminate()
+        subprocess.run(["pmset", "displaysleepnow"])
 
-            renderer = ImageRenderer()
-            #target = renderer.load_image("./simplest_smoll.png")
-            #target = renderer.load_image("./simple_smoll.png")
-            target = renderer.load_image("./majesticUnicorn_smoll.png")
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    """
+    parser = argparse.ArgumentParser(description="Approximate an image with evolving polygons.")
+    parser.add_argument("--target", default="./majesticUnicorn_smoll.png", help="image to approximate")
+    parser.add_argument("--method", choices=("V1", "V2"), default="V2", help="genetic algorithm version")
+    parser.add_argument("--generations", type=int, help="number of generations (the method's default if omitted)")
+    parser.add_argument("--population", type=int, help="candidates per generation")
+    parser.add_argument("--genes", type=int, help="polygons per individual")
+    parser.add_argument("--seed", type=int, help="seed for a reproducible run")
+    parser.add_argument("--output", default="./polyevolve_images", help="directory for images and the plot (V2)")
+    parser.add_argument("--backend", choices=("pillow", "inplace"), default="inplace", help="rendering backend (V2)")
+    parser.add_argument("--workers", type=int, default=1, help="fitness evaluation processes (V2)")
+    parser.add_argument("--arrays", action="store_true",
+                        help="hold each generation in NumPy arrays and mutate it in one pass (V2, serial only)")
+    parser.add_argument("--plot", choices=("show", "save", "none"), default="show",
+                        help="show the fitness plot, save it to the output directory, or skip it")
+    parser.add_argument("--plot-points", type=int, help="plot at most this many generations of a long run")
+    parser.add_argument("--headless", action="store_true",
+                        help="never open windows: a requested plot is saved instead of shown")
+    parser.add_argument("--power-hooks", action="store_true",
+                        help="macOS only: keep the machine awake and sleep the display when done")
+    return parser.parse_args(argv)
+
+def run(args):
+    """
+    Runs the genetic algorithm selected by the options.
 
-            gen_alg = GeneticAlgorithm(target)
-            gen_alg.evolve()
-            plot(gen_alg)
+    Returns:
+        The finished GeneticAlgorithm.
+    """
+    if args.method == "V1":
+        import numpy as np
+        if args.seed is not None: # version 1 draws from the global generators
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+
+        from version_1.genetic_algorithm import GeneticAlgorithm
+        from version_1.image_renderer import ImageRenderer
+
+        target = ImageRenderer().load_image(args.target)
+        gen_alg = GeneticAlgorithm(target)
+    else:
+        from version_2.genetic_algorithm import GeneticAlgorithm
+        from version_2.image_renderer import ImageRenderer
+        from version_2.snapshot_writer import SnapshotWriter
+
+        target = ImageRenderer().load_image(args.target)
+        gen_alg = GeneticAlgorithm(target, render_backend=args.backend, num_workers=args.workers,
+                                   array_mode=args.arrays,
+                                   snapshot_writer=SnapshotWriter(directory=args.output), seed=args.seed)
+
+    if args.generations is not None:
+        gen_alg.num_generations = args.generations
+    if args.population is not None:
+        gen_alg.population_size = args.population
+    if args.genes is not None:
+        gen_alg.num_genes = args.genes
+
+    gen_alg.evolve()
+    return gen_alg
+
+def main(argv=None):
+    args = parse_args(argv)
+    with power_hooks(args.power_hooks):
+        gen_alg = run(args)
+
+    if args.plot == "save" or (args.plot == "show" and args.headless):
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(args.output, "fitness.png")
+        plot(gen_alg, path=path, show=False, max_points=args.plot_points)
+        print(f"Saved the fitness plot to {path}")
+    elif args.plot == "show":
+        plot(gen_alg, max_points=args.plot_points)
 
-        else:
-            raise ValueError("Unknown method")
+if __name__ == "__main__":
+    """
+    Runs the genetic algorithm.
 
-    finally:
-        caffeinate.terminate()
-        os.system("pmset displaysleepnow")
\ No newline at end of file
+    Saves files and displays (or saves) the fitness plot.
+    """
+    main()
@@ -0,0 +1,118 @@
+"""
+background_writer.py
+
+The background thread behind SnapshotWriter (snapshot_writer.py) and
+Checkpointer (checkpoint.py): the run queues items and returns at once,
+and a daemon thread writes them one at a time.
+
+NOTES:
+    - subclasses implement write(item), and queue items with put() (waits
+      while the queue is full) or replace() (drops the waiting item)
+    - if a write fails, the thread stops and the error is raised from the
+      next start() or flush()
+    - flush() stops the thread once the queue is written; the next start()
+      starts a new one, so a writer can serve several runs
+"""
+
+import queue
+import threading
+
+class BackgroundWriter:
+    """
+    Writes queued items on a background thread.
+    """
+
+    name = "background-writer" # name of the thread
+
+    def __init__(self, queue_size):
+        """
+        Args:
+            queue_size (int): Items that may wait to be written.
+        """
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.error = None # exception that stopped the thread, raised once by start() or flush()
+        self.num_written = 0
+
+    def start(self):
+        """
+        Raises the error of a failed write, then starts the thread if it is
+        not running.
+        """
+        self.raise_error()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def put(self, item):
+        """
+        Queues an item, waiting for room only while the thread is alive.
+        """
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=.1)
+                return
+            except queue.Full:
+                pass
+
+    def replace(self, item):
+        """
+        Queues an item in place of any waiting one, without blocking.
+        """
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def raise_error(self):
+        """
+        Raises the error that stopped the thread, if there is one.
+        """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        """
+        Writes queued items until flush() sends None, or until a write fails.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.write(item)
+            except Exception as error:
+                self.error = error
+                break
+            self.num_written += 1
+
+    def write(self, item):
+        """
+        Writes one item; implemented by subclasses.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Waits for every queued item to be written and stops the thread.
+        Raises the error of a failed write, if it was not raised yet.
+        """
+        if self.thread is not None:
+            self.put(None) # None waits behind the queued items
+            self.thread.join()
+            self.thread = None
+            while not self.queue.empty(): # left behind by a failed thread
+                self.queue.get_nowait()
+        self.raise_error()
+
+    def close(self):
+        """
+        Flushes the writer; it holds nothing else.
+        """
+        self.flush()
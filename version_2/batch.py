@@ -0,0 +1,305 @@
+"""
+batch.py
+
+Evolves approximations of many target images: a BatchRunner takes a
+directory of images, a manifest file, or a list of paths, and runs one
+GeneticAlgorithm per target on a pool of worker processes, each job with
+its own generation and time budget.
+
+For every finished job the output directory receives:
+    <name>.log          run log (run_log.py) of the job's elite
+                        improvements; its last record is the final genome
+    <name>.stats.json   per-generation elite fitness and timing
+and a line in results.jsonl, written last. A job that raises gets a line
+with its name and the error instead, and the batch goes on. A batch that
+was interrupted is resumed by running it again with the same output
+directory: jobs that finished are skipped, failed and unfinished ones
+start over.
+
+Run from the repository root:
+    python -m version_2.batch <directory or manifest> <output directory>
+    python -m version_2.batch images out --jobs 4 --time-budget 60 --seed 1
+
+NOTES:
+    - a manifest is a text file with one image path per line (relative to
+      the manifest); blank lines and lines starting with # are ignored
+    - a job is named after its path relative to the batch's root, without
+      the extension, unless that name is taken (a.png and a.jpg become
+      a.png and a.jpg)
+    - job seeds are derived from the batch seed and the job's name, so a
+      resumed batch runs the same jobs even if targets were added or removed
+      in the meantime (unless that changes the job's name, see above)
+    - the jobs' "Generation N" lines are not printed
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from version_2.genetic_algorithm import GeneticAlgorithm
+from version_2.metrics import METRICS
+from version_2.run_log import RunLog
+from version_2.snapshot_writer import SnapshotWriter
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+RESULTS_FILE = "results.jsonl"
+
+def find_targets(source):
+    """
+    Lists the target images of a batch.
+
+    Args:
+        source: A directory (searched recursively), a manifest file, or a list of paths.
+
+    Returns:
+        (list): (name, path) of every target, sorted by path. Names are unique
+        and safe to use as file names.
+    """
+    if isinstance(source, (list, tuple)):
+        paths = list(source)
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else ""
+    elif os.path.isdir(source):
+        paths = [os.path.join(directory, file) for directory, _, files in os.walk(source)
+                 for file in files if file.lower().endswith(IMAGE_EXTENSIONS)]
+        root = os.path.abspath(source)
+    else:
+        with open(source) as manifest:
+            lines = [line.strip() for line in manifest]
+        base = os.path.dirname(os.path.abspath(source))
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+        root = base
+
+    paths = sorted(paths)
+    relatives = [(os.path.relpath(os.path.abspath(path), root) if root else path).replace(os.sep, "__")
+                 for path in paths]
+    stems = [os.path.splitext(relative)[0] for relative in relatives]
+    stem_counts = Counter(stems)
+
+    targets = []
+    names = set()
+    for path, relative, stem in zip(paths, relatives, stems):
+        name = stem if stem_counts[stem] == 1 else relative # a.png and a.jpg keep their extensions
+        unique, count = name, 1
+        while unique in names: # the same path listed twice
+            count += 1
+            unique = f"{name}_{count}"
+        names.add(unique)
+        targets.append((unique, path))
+    return targets
+
+class BatchRunner:
+    """
+    Schedules one evolution job per target image on a process pool.
+    """
+
+    def __init__(self, source, output_directory="./polyevolve_batch", num_workers=1, num_generations=2000,
+                 time_budget=None, population_size=50, seed=None, **options):
+        """
+        Args:
+            source: A directory, a manifest file, or a list of image paths.
+            output_directory (str): Where genomes, stats and results.jsonl are written.
+            num_workers (int): Jobs that run at the same time, one process each.
+            num_generations (int): Generation budget of each job.
+            time_budget (float): Seconds each job may run, None for no limit.
+            population_size (int): Candidates per generation.
+            seed (int): Seed the jobs' seeds are derived from.
+            options: Further GeneticAlgorithm arguments for every job
+                (render_backend, incremental, early_exit, sample).
+        """
+        self.targets = find_targets(source)
+        self.output_directory = output_directory
+        self.num_workers = num_workers
+        self.num_generations = num_generations
+        self.time_budget = time_budget
+        self.population_size = population_size
+        self.options = options
+
+        # one SeedSequence per job, fixed by the job's name
+        root = np.random.SeedSequence(seed)
+        self.seeds = [job_seed(root, name) for name, _ in self.targets]
+
+        self.results = [] # result of every job finished by this run
+        self.failures = [] # name and error of every job that raised in this run
+        self.num_skipped = 0 # jobs already finished by an earlier run
+        self.wall_time = 0
+
+    def finished(self):
+        """
+        Names of the jobs recorded as finished in results.jsonl. Failures
+        and a line cut short by a crash are ignored.
+        """
+        names = set()
+        path = os.path.join(self.output_directory, RESULTS_FILE)
+        if os.path.exists(path):
+            with open(path) as results:
+                for line in results:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "name" in result and "error" not in result:
+                        names.add(result["name"])
+        return names
+
+    def run(self):
+        """
+        Runs every job that is not finished yet, recording each result (or
+        failure) as it comes in.
+
+        Returns:
+            (list): The results of the jobs this run finished.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        finished = self.finished()
+        jobs = [(name, path, seed) for (name, path), seed in zip(self.targets, self.seeds) if name not in finished]
+        self.num_skipped = len(self.targets) - len(jobs)
+
+        results_path = os.path.join(self.output_directory, RESULTS_FILE)
+        with open(results_path, "a+") as results:
+            if results.tell() > 0:
+                results.seek(results.tell() - 1)
+                if results.read(1) != "\n":
+                    results.write("\n") # end a line cut short by a crash
+
+        start_time = time.perf_counter()
+        with open(results_path, "a") as results, ProcessPoolExecutor(max_workers=self.num_workers) as pool:
+            futures = {pool.submit(run_job, name, path, seed, self.output_directory, self.num_generations,
+                                   self.time_budget, self.population_size, self.options): name
+                       for name, path, seed in jobs}
+
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:
+                    result = {"name": futures[future], "error": f"{type(error).__name__}: {error}"}
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+                os.fsync(results.fileno())
+
+                done = len(self.results) + len(self.failures) + 1
+                if "error" in result:
+                    self.failures.append(result)
+                    print(f"[{done + self.num_skipped}/{len(self.targets)}] {result['name']}: failed, {result['error']}")
+                    continue
+                self.results.append(result)
+                print(f"[{done + self.num_skipped}/{len(self.targets)}] {result['name']}: "
+                      f"{result['metric']} error {result['elite_error']:.2f} in {result['generations']} generations, "
+                      f"{result['seconds']:.1f} s")
+        self.wall_time = time.perf_counter() - start_time
+        return self.results
+
+    def throughput(self):
+        """
+        Images finished per hour of wall time by the last run().
+        """
+        return len(self.results) / self.wall_time * 3600 if self.wall_time > 0 else 0.0
+
+    def report(self):
+        """
+        Prints aggregate results of the last run().
+        """
+        if self.failures:
+            print(f"{len(self.failures)} jobs failed: " + ", ".join(failure["name"] for failure in self.failures))
+        if not self.results:
+            if not self.failures:
+                print(f"Nothing to do: {self.num_skipped} of {len(self.targets)} jobs were already finished")
+            return
+        job_seconds = sum(result["seconds"] for result in self.results)
+        print(f"{len(self.results)} images in {self.wall_time:.1f} s ({self.num_skipped} already finished)")
+        print(f"throughput:   {self.throughput():.1f} images/hour")
+        print(f"mean job:     {job_seconds / len(self.results):.2f} s, "
+              f"{np.mean([result['generations'] for result in self.results]):.0f} generations")
+        print(f"mean error:   {np.mean([result['elite_error'] for result in self.results]):.2f}")
+        print(f"worker usage: {job_seconds / (self.wall_time * self.num_workers):.0%}")
+
+def job_seed(root, name):
+    """
+    A job's SeedSequence: a child of the batch's, keyed by a hash of the
+    job's name rather than by the job's position.
+    """
+    digest = hashlib.sha256(name.encode("utf-8")).digest()
+    key = tuple(int.from_bytes(digest[i:i + 4], "little") for i in range(0, 16, 4))
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + key)
+
+def run_job(name, path, seed, output_directory, num_generations, time_budget, population_size, options):
+    """
+    Evolves one target and writes its outputs. Runs in a worker process.
+
+    Returns:
+        (dict): The job's result, as recorded in results.jsonl.
+    """
+    start_time = time.perf_counter()
+    target = Image.open(path).convert("RGB")
+
+    # an unfinished earlier attempt is started over
+    log_path = os.path.join(output_directory, name + ".log")
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+    run_log = RunLog(log_path)
+    try:
+        gen_alg = GeneticAlgorithm(target, retention="none", snapshot_writer=SnapshotWriter(policy="none"),
+                                   run_log=run_log, seed=seed, **options)
+        gen_alg.num_generations = num_generations
+        gen_alg.population_size = population_size
+        gen_alg.time_budget = time_budget
+        with contextlib.redirect_stdout(io.StringIO()):
+            gen_alg.evolve()
+    finally:
+        run_log.close()
+
+    stats = {name: [None if np.isnan(value) else value for value in gen_alg.stats.column(name).tolist()]
+             for name in ("generation", "elite_fitness", "mean_fitness", "sampled", "wall_time")} # NaN is not JSON
+    with open(os.path.join(output_directory, name + ".stats.json"), "w") as file:
+        json.dump(stats, file)
+
+    elite = gen_alg.elite_individual
+    return {
+        "name": name,
+        "path": os.path.abspath(path),
+        "size": list(target.size),
+        "seed": {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)}, # SeedSequence(entropy, spawn_key=...)
+        "generations": gen_alg.generations_done,
+        "fitness": elite.fitness,
+        "metric": gen_alg.error_metric,
+        "elite_error": gen_alg.evaluator.max_error - elite.fitness, # in the units of the job's metric
+        "vertices": sum(len(gene.vertices) for gene in elite.genome),
+        "seconds": time.perf_counter() - start_time,
+        "log": name + ".log",
+    }
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    """
+    parser = argparse.ArgumentParser(description="Evolve approximations of many images as a resumable batch.")
+    parser.add_argument("source", help="directory of images or manifest file")
+    parser.add_argument("output", help="directory for the logs, stats and results.jsonl")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="jobs that run at the same time")
+    parser.add_argument("--generations", type=int, default=500, help="generation budget of each job")
+    parser.add_argument("--time-budget", type=float, help="seconds each job may run")
+    parser.add_argument("--population", type=int, default=50, help="candidates per generation")
+    parser.add_argument("--seed", type=int, help="seed for a reproducible batch")
+    parser.add_argument("--backend", choices=("pillow", "inplace"), default="inplace", help="rendering backend")
+    parser.add_argument("--metric", choices=METRICS, default="ssd", help="fitness metric (see metrics.py)")
+    parser.add_argument("--incremental", action="store_true", help="re-render only the region mutation changed")
+    parser.add_argument("--early-exit", action="store_true", help="stop scoring candidates that are certainly worse")
+    parser.add_argument("--arrays", action="store_true",
+                        help="hold each generation in NumPy arrays and mutate it in one pass")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    runner = BatchRunner(args.source, args.output, num_workers=args.jobs, num_generations=args.generations,
+                         time_budget=args.time_budget, population_size=args.population, seed=args.seed,
+                         render_backend=args.backend, error_metric=args.metric, incremental=args.incremental,
+                         early_exit=args.early_exit, array_mode=args.arrays)
+    runner.run()
+    runner.report()
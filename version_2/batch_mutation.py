@@ -0,0 +1,177 @@
+"""
+batch_mutation.py
+
+Mutation operators that act on a whole GenerationArrays in a single NumPy
+pass, instead of one Individual and one Gene at a time.
+
+They follow Individual.mutate and Gene:
+    - each member mutates int(genes * rate) distinct genes
+    - each selected gene gets one of: vertex perturbation, vertex
+      insertion, color perturbation (equally likely)
+    - vertices are clamped to the canvas (Gene.clamp), color channels are
+      wrapped (Gene.wrap), alpha is left alone
+    - an inserted vertex is the perturbed midpoint of two adjacent vertices;
+      the polygon must stay simple and valid (up to 100 attempts), then its
+      vertices are sorted clockwise about the centroid (Gene.order_cw);
+      validity is checked with geometry.py, a batch of polygons per call
+
+All randomness comes from the np.random.Generator passed in.
+"""
+
+import numpy as np
+from version_2 import geometry
+
+PERTURB_VERTICES, INSERT_VERTEX, PERTURB_COLOR = 0, 1, 2
+
+def mutate(arrays, rng, gene_mutation_rate=.25):
+    """
+    Mutates every member of a generation in place.
+
+    Args:
+        arrays (GenerationArrays): The generation to mutate.
+        rng (Generator): Source of randomness.
+        gene_mutation_rate (float): Fraction of each member's genes to mutate.
+
+    Returns:
+        (ndarray): (population, 4) dirty box of each member (union of the old
+        and new bounding boxes of its mutated genes), -1 rows where nothing changed.
+    """
+    population, num_genes = arrays.counts.shape
+    num_mutations = int(num_genes * gene_mutation_rate)
+    if num_mutations == 0:
+        return np.full((population, 4), -1, dtype=np.int32) # nothing changes
+
+    # distinct genes per member: the first num_mutations of a random permutation
+    order = rng.random((population, num_genes)).argsort(axis=1)
+    selected = np.zeros((population, num_genes), dtype=bool)
+    np.put_along_axis(selected, order[:, :num_mutations], True, axis=1)
+
+    mutation_type = rng.integers(0, 3, size=(population, num_genes))
+    old_boxes = bounding_boxes(arrays)
+
+    perturb_vertices(arrays, selected & (mutation_type == PERTURB_VERTICES), rng)
+    insert_vertices(arrays, selected & (mutation_type == INSERT_VERTEX), rng)
+    perturb_colors(arrays, selected & (mutation_type == PERTURB_COLOR), rng)
+
+    return union_boxes(old_boxes, bounding_boxes(arrays), selected)
+
+def perturb_vertices(arrays, mask, rng):
+    """
+    Moves every vertex of the masked genes by up to 10% of the smaller
+    canvas dimension, clamped to the canvas.
+
+    Args:
+        arrays (GenerationArrays): The generation to mutate in place.
+        mask (ndarray): (population, genes) genes to perturb.
+        rng (Generator): Source of randomness.
+    """
+    max_x, max_y = arrays.size
+    radius = int(min(max_x, max_y) * .1)
+
+    # only the masked genes are drawn for and written back
+    members, genes = np.nonzero(mask)
+    points = arrays.vertices[members, genes]
+    in_use = np.arange(arrays.max_vertices) < arrays.counts[members, genes][:, None]
+
+    moved = points + rng.integers(-radius, radius + 1, size=points.shape, dtype=np.int32)
+    np.clip(moved[..., 0], 0, max_x, out=moved[..., 0])
+    np.clip(moved[..., 1], 0, max_y, out=moved[..., 1])
+    arrays.vertices[members, genes] = np.where(in_use[..., None], moved, points)
+
+def perturb_colors(arrays, mask, rng):
+    """
+    Moves the RGB channels of the masked genes by up to 10, wrapping
+    around the 0-255 range as Gene.wrap does.
+
+    Args:
+        arrays (GenerationArrays): The generation to mutate in place.
+        mask (ndarray): (population, genes) genes to perturb.
+        rng (Generator): Source of randomness.
+    """
+    radius = 10
+    members, genes = np.nonzero(mask)
+    rgb = arrays.colors[members, genes, :3].astype(np.int16)
+    rgb += rng.integers(-radius, radius + 1, size=rgb.shape, dtype=np.int16)
+    rgb = np.where(rgb < 0, 255 + rgb, np.where(rgb > 255, rgb - 255, rgb))
+    arrays.colors[members, genes, :3] = rgb
+
+def insert_vertices(arrays, mask, rng, max_attempts=100):
+    """
+    Adds a vertex to each masked gene: the midpoint of two random adjacent
+    vertices, perturbed by up to 5% of the smaller canvas dimension. An
+    attempt is kept only if the polygon stays valid. Most genes succeed at
+    once, so the first pass makes one attempt per gene; each later pass
+    doubles the attempts of the genes still left and keeps the first valid
+    one, so stragglers need a few passes rather than one pass per attempt.
+
+    Args:
+        arrays (GenerationArrays): The generation to mutate in place.
+        mask (ndarray): (population, genes) genes to grow.
+        rng (Generator): Source of randomness.
+        max_attempts (int): Attempts per gene before giving up.
+    """
+    max_x, max_y = arrays.size
+    radius = int(min(max_x, max_y) * .05)
+
+    members, genes = np.nonzero(mask)
+    if len(members) == 0:
+        return
+    arrays.ensure_capacity(int(arrays.counts[members, genes].max()) + 1)
+
+    grown_members, grown_genes, grown_points = [], [], [] # written back and ordered at the end
+    done = 0
+    tries = 1
+    while len(members) and done < max_attempts:
+        tries = min(tries, max_attempts - done)
+        counts = arrays.counts[members, genes]
+        points = arrays.vertices[members, genes]
+        rows = np.arange(len(members))[:, None]
+
+        # perturbed midpoints of vertices i and i + 1, i in [0, count - 2], tries per gene
+        first = (rng.random((len(members), tries)) * (counts - 1)[:, None]).astype(np.intp)
+        midpoints = (points[rows, first] + points[rows, first + 1]) // 2
+        midpoints += rng.integers(-radius, radius + 1, size=midpoints.shape, dtype=np.int32)
+        np.clip(midpoints[..., 0], 0, max_x, out=midpoints[..., 0])
+        np.clip(midpoints[..., 1], 0, max_y, out=midpoints[..., 1])
+
+        # append each attempt to its own copy of the polygon and keep the first valid one
+        attempts = np.repeat(points[:, None], tries, axis=1)
+        attempts[rows, np.arange(tries), counts[:, None]] = midpoints
+        valid = geometry.valid_shapes(attempts.reshape(-1, *points.shape[1:]),
+                                      np.repeat(counts + 1, tries)).reshape(len(members), tries)
+        grown = valid.any(axis=1)
+        grown_members.append(members[grown])
+        grown_genes.append(genes[grown])
+        grown_points.append(attempts[grown, valid[grown].argmax(axis=1)])
+
+        members, genes = members[~grown], genes[~grown]
+        done += tries
+        tries *= 2
+
+    members, genes = np.concatenate(grown_members), np.concatenate(grown_genes)
+    arrays.counts[members, genes] += 1
+    arrays.vertices[members, genes] = geometry.order_clockwise(np.concatenate(grown_points),
+                                                               arrays.counts[members, genes])
+
+def bounding_boxes(arrays):
+    """
+    (population, genes, 4) bounding box of every gene, exclusive ends.
+    """
+    in_use = (np.arange(arrays.max_vertices) < arrays.counts[..., None])[..., None]
+    low = np.where(in_use, arrays.vertices, np.iinfo(np.int32).max).min(axis=2)
+    high = np.where(in_use, arrays.vertices, -1).max(axis=2) + 1
+    return np.concatenate((low, high), axis=2)
+
+def union_boxes(old_boxes, new_boxes, selected):
+    """
+    Per member, the union of the old and new boxes of its selected genes.
+    """
+    big = np.iinfo(np.int32).max
+    low = np.minimum(old_boxes[..., :2], new_boxes[..., :2])
+    high = np.maximum(old_boxes[..., 2:], new_boxes[..., 2:])
+    low = np.where(selected[..., None], low, big).min(axis=1)
+    high = np.where(selected[..., None], high, -1).max(axis=1)
+
+    boxes = np.concatenate((low, high), axis=1)
+    boxes[~selected.any(axis=1)] = -1
+    return boxes
@@ -0,0 +1,538 @@
+"""
+benchmark.py
+
+Times the hot paths of version 2 on synthetic individuals so engine changes
+can be compared against each other.
+
+Run from the repository root:
+    python -m version_2.benchmark                       (comparison tables)
+    python -m version_2.benchmark --suite --output results.json
+    python -m version_2.benchmark --suite --baseline baseline.json
+
+The suite times each hot path (create_image, evaluate_fitness_mse,
+Individual.mutate, Gene.add_vertex, GeneticAlgorithm.reproduce), the
+error of every fitness metric and full generations over a matrix of
+configurations, and writes JSON that a later
+run compares against to flag regressions (exit status 1).
+
+Timings on a shared machine drift by tens of percent within seconds, so
+the suite runs several interleaved passes (--repeats) of measurements at
+least --min-time long and keeps medians, and the comparison checks each
+ratio against the median ratio of the whole suite (see compare()).
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+from version_2 import batch_mutation
+from version_2.evaluator import MAX_POSSIBLE_MSE, Evaluator, SampledEvaluator
+from version_2.generation_arrays import GenerationArrays
+from version_2.genetic_algorithm import GeneticAlgorithm
+from version_2.image_renderer import ImageRenderer, BACKENDS
+from version_2.individual import Individual
+from version_2.metrics import METRICS, make_metric
+from version_2.pyramid import Pyramid
+from version_2.sampling import FitnessSample
+from version_2.target import Target
+from version_2.snapshot_writer import SnapshotWriter
+
+def synthetic_individual(size, num_genes, num_vertices=3, seed=0):
+    """
+    Builds a reproducible random individual.
+
+    Args:
+        size (tuple): (width, height) of the canvas.
+        num_genes (int): Number of genes (polygons).
+        num_vertices (int): Number of vertices each polygon is grown to.
+        seed (int): Seed for the random stream.
+
+    Returns:
+        (Individual): The synthetic individual.
+    """
+    rng = np.random.default_rng(seed)
+    individual = Individual(size, num_genes=num_genes, rng=rng)
+    for gene in individual.genome:
+        while gene.num_vertices < num_vertices:
+            gene.add_vertex(rng)
+    return individual
+
+def time_call(function, repeats):
+    """
+    Times a function, returning the best of several runs in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark_renderers(size, num_genes, num_vertices=3, repeats=20):
+    """
+    Times every rendering backend on the same individual.
+
+    Returns:
+        (dict): Seconds per render for each backend, plus the fraction of
+        pixels where the inplace backend differs from the pillow backend.
+    """
+    individual = synthetic_individual(size, num_genes, num_vertices)
+    results = {}
+    images = {}
+
+    for backend in BACKENDS:
+        renderer = ImageRenderer(backend=backend)
+        images[backend] = renderer.render_array(individual)
+        results[backend] = time_call(lambda: renderer.render_array(individual), repeats)
+
+    differing = np.any(images["pillow"] != images["inplace"], axis=2)
+    results["differing_pixels"] = float(differing.mean())
+    return results
+
+def benchmark_metrics(target, num_genes=50, repeats=5, min_time=0.0):
+    """
+    Times every fitness metric of metrics.py on the same rendered candidate.
+
+    Args:
+        target (Image): The target image.
+        num_genes (int): Genes of the synthetic candidate.
+        repeats (int): Runs per measurement; the best is kept.
+        min_time (float): Least seconds per run, see time_per_call().
+
+    Returns:
+        (dict): Seconds per candidate for each metric: its error only, since
+        the render costs the same for every metric.
+    """
+    prepared = Target(target)
+    pixels = ImageRenderer(backend="inplace").render_array(synthetic_individual(target.size, num_genes))
+    results = {}
+    for name in METRICS:
+        metric = make_metric(name, prepared, (.299, .587, .114) if name == "weighted" else None)
+        results[name] = time_per_call(lambda: metric.error(pixels), 5, repeats, min_time)
+    return results
+
+def benchmark_cloning(num_genes, population_size=50, mutation_rate=.25, repeats=5):
+    """
+    Compares deep-copy cloning with copy-on-write cloning for one generation
+    of reproduce() (clone the elite, then mutate each clone).
+
+    Returns:
+        (dict): Seconds, allocated blocks and allocated bytes per generation for each method.
+    """
+    elite = synthetic_individual((320, 180), num_genes)
+    methods = {
+        "deepcopy": lambda: copy.deepcopy(elite),
+        "clone": elite.clone,
+    }
+
+    results = {}
+    for name, clone in methods.items():
+        def generation():
+            clones = [clone() for _ in range(population_size)]
+            for individual in clones:
+                individual.mutate(mutation_rate, rng)
+            return clones
+
+        rng = np.random.default_rng(0)
+        seconds = time_call(generation, repeats)
+
+        rng = np.random.default_rng(0)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        clones = generation()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        growth = after.compare_to(before, "filename")
+        results[name] = {
+            "seconds": seconds,
+            "blocks": sum(stat.count_diff for stat in growth),
+            "bytes": sum(stat.size_diff for stat in growth),
+        }
+        del clones
+
+    return results
+
+def benchmark_mutation(num_genes, population_size=50, mutation_rate=.25, repeats=5):
+    """
+    Compares one generation of reproduce() on Individuals (clone and mutate
+    each one) with batch mutation of a GenerationArrays of elite clones.
+
+    Returns:
+        (dict): Seconds per generation for each method.
+    """
+    elite = synthetic_individual((320, 180), num_genes)
+    rng = np.random.default_rng(0)
+
+    def objects():
+        for _ in range(population_size):
+            elite.clone().mutate(mutation_rate, rng)
+
+    def arrays():
+        offspring = GenerationArrays.clones(elite, population_size)
+        batch_mutation.mutate(offspring, rng, mutation_rate)
+
+    return {"objects": time_call(objects, repeats), "arrays": time_call(arrays, repeats)}
+
+def time_to_mse(stats, mse, resolution):
+    """
+    Seconds of evolution until the elite first reached an MSE at a resolution.
+
+    Returns:
+        (float): The seconds, or None if it never did.
+    """
+    rows = stats.array
+    width, height = resolution
+    reached = np.flatnonzero((rows.width == width) & (rows.height == height) &
+                             (MAX_POSSIBLE_MSE - rows.elite_fitness <= mse))
+    if not len(reached):
+        return None
+    return float(rows.wall_time[:reached[0] + 1].sum())
+
+def benchmark_pyramid(image, mse_thresholds, num_generations=600, num_levels=3, schedule=None, seed=0):
+    """
+    Compares full-resolution evolution with coarse-to-fine evolution over a
+    Pyramid, by the time each takes to reach full-resolution MSE thresholds.
+
+    Returns:
+        (dict): For "full" and "pyramid", seconds to reach each threshold (None if not reached).
+    """
+    pyramid = Pyramid(image, num_levels, schedule=schedule)
+
+    results = {}
+    for name, levels in (("full", None), ("pyramid", pyramid)):
+        gen_alg = GeneticAlgorithm(image, retention="none", snapshot_writer=SnapshotWriter(policy="none"), pyramid=levels,
+                                   seed=seed)
+        gen_alg.num_generations = num_generations
+        with contextlib.redirect_stdout(io.StringIO()):
+            gen_alg.evolve()
+        results[name] = {mse: time_to_mse(gen_alg.stats, mse, image.size) for mse in mse_thresholds}
+    return results
+
+def benchmark_sampling(image, samples, render_backend="inplace", num_genes=50, population_size=50, repeats=3):
+    """
+    Times the scoring of one generation of mutated elite clones in full and
+    on each FitnessSample. Confirmations are reported separately, since how
+    many candidates beat the elite on the sample depends on the run.
+
+    Returns:
+        (dict): Seconds per generation for "full"; for each sample (by index)
+        the seconds to score on the sample, the candidates that beat the
+        elite there and the seconds to confirm them.
+    """
+    target = Target(image)
+    elite = synthetic_individual(target.size, num_genes)
+    rng = np.random.default_rng(0)
+    population = [elite.clone() for _ in range(population_size)]
+    for individual in population:
+        individual.mutate(.25, rng)
+
+    full = Evaluator(target, render_backend)
+    results = {"full": time_call(lambda: full.evaluate(population), repeats)}
+
+    for i, sample in enumerate(samples):
+        evaluator = SampledEvaluator(target, render_backend, sample)
+        evaluator.set_elite(elite)
+        seconds = time_call(lambda: evaluator.evaluate(population), repeats)
+
+        scores = evaluator.evaluate(population)
+        for individual, score in zip(population, scores):
+            individual.set_fitness(score)
+        ranked = sorted(population, key=lambda individual: individual.fitness, reverse=True)
+        start = time.perf_counter()
+        evaluator.confirm(ranked)
+
+        results[i] = {"score": seconds, "confirmed": evaluator.num_confirmed,
+                      "confirm": time.perf_counter() - start}
+    return results
+
+SUITE_MATRIX = {
+    "sizes": [(64, 48), (160, 120), (320, 240)],
+    "genes": [10, 50],
+    "vertices": [3, 6],
+    "populations": [20, 50],
+}
+QUICK_MATRIX = {
+    "sizes": [(64, 48), (160, 120)],
+    "genes": [10],
+    "vertices": [3],
+    "populations": [20],
+}
+
+def synthetic_target(size, seed=0):
+    """
+    Builds a reproducible target image: a gradient under a busy random individual.
+    """
+    width, height = size
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 255, height)[:, None]
+    gradient = np.stack(np.broadcast_arrays(x + 0 * y, y + 0 * x, (x + y) / 2), axis=2).astype(np.uint8)
+
+    shapes = ImageRenderer().create_image(synthetic_individual(size, 40, num_vertices=4, seed=seed + 1)).convert("RGB")
+    return Image.blend(Image.fromarray(gradient, "RGB"), shapes, .5)
+
+def time_per_call(function, number, repeats, min_time=0.0):
+    """
+    Times a function called number times in a row, returning the best
+    seconds per call over several runs. With min_time, number is first
+    raised until one run takes at least that long, so that sub-millisecond
+    calls are not timed at the scale of clock and scheduler noise.
+    """
+    def calls():
+        for _ in range(number):
+            function()
+
+    while True:
+        start = time.perf_counter()
+        calls()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(2 * number, math.ceil(1.2 * number * min_time / max(elapsed, 1e-9)))
+    if repeats > 1: # the run that reached min_time counts as the first
+        elapsed = min(elapsed, time_call(calls, repeats - 1))
+    return elapsed / number
+
+def suite_pass(matrix, num_generations, seed, min_time):
+    """
+    One pass of run_suite() over the matrix, timing each measurement once.
+
+    Returns:
+        (dict): Seconds per operation keyed by operation and configuration.
+    """
+    results = {}
+
+    for size in matrix["sizes"]:
+        target = synthetic_target(size, seed)
+        for name, seconds in benchmark_metrics(target, repeats=1, min_time=min_time).items():
+            results[f"metric[{name}] size={size[0]}x{size[1]}"] = seconds
+
+        for num_genes in matrix["genes"]:
+            for num_vertices in matrix["vertices"]:
+                config = f"size={size[0]}x{size[1]} genes={num_genes} vertices={num_vertices}"
+                individual = synthetic_individual(size, num_genes, num_vertices, seed)
+                rng = np.random.default_rng(seed)
+
+                for backend in BACKENDS:
+                    renderer = ImageRenderer(backend=backend)
+                    results[f"create_image[{backend}] {config}"] = \
+                        time_per_call(lambda: renderer.create_image(individual), 5, 1, min_time)
+
+                    gen_alg = GeneticAlgorithm(target, render_backend=backend, retention="none",
+                                               snapshot_writer=SnapshotWriter(policy="none"), seed=seed)
+                    results[f"evaluate_fitness_mse[{backend}] {config}"] = \
+                        time_per_call(lambda: gen_alg.evaluate_fitness_mse(individual), 5, 1, min_time)
+
+                results[f"mutate {config}"] = \
+                    time_per_call(lambda: individual.clone().mutate(.25, rng), 50, 1, min_time)
+                results[f"add_vertex {config}"] = \
+                    time_per_call(lambda: individual.genome[0].copy().add_vertex(rng), 50, 1, min_time)
+
+                for population_size in matrix["populations"]:
+                    gen_config = f"{config} population={population_size}"
+                    gen_alg = GeneticAlgorithm(target, retention="none", snapshot_writer=SnapshotWriter(policy="none"),
+                                               seed=seed)
+                    gen_alg.population_size = population_size
+                    gen_alg.elite_individual = individual
+                    results[f"reproduce {gen_config}"] = time_per_call(gen_alg.reproduce, 3, 1, min_time)
+                    results[f"reproduce_arrays {gen_config}"] = \
+                        time_per_call(gen_alg.reproduce_arrays, 3, 1, min_time)
+
+                    modes = {backend: {"render_backend": backend} for backend in BACKENDS}
+                    modes["incremental"] = {"incremental": True}
+                    modes["arrays"] = {"array_mode": True}
+                    for mode, options in modes.items():
+                        best = float("inf")
+                        seconds = 0
+                        while seconds < min_time: # runs from the same seed, added until min_time
+                            gen_alg = GeneticAlgorithm(target, retention="none", snapshot_writer=SnapshotWriter(policy="none"),
+                                                       seed=seed, **options)
+                            gen_alg.num_generations = num_generations
+                            gen_alg.population_size = population_size
+                            gen_alg.num_genes = num_genes
+                            gen_alg.elite_individual = individual.clone() # start from the configured genome
+                            with contextlib.redirect_stdout(io.StringIO()):
+                                gen_alg.evolve()
+                            best = min(best, float(gen_alg.stats.column("wall_time").mean()))
+                            seconds += float(gen_alg.stats.column("wall_time").sum())
+                        results[f"generation[{mode}] {gen_config}"] = best
+    return results
+
+def run_suite(matrix=None, repeats=6, num_generations=10, seed=0, min_time=.1):
+    """
+    Times the individual hot paths and full generations over a matrix of
+    image sizes, gene counts, vertex counts and population sizes, on
+    synthetic targets with fixed seeds.
+
+    The whole matrix is run repeats times and each measurement keeps the
+    median of its passes. Interleaving the repeats this way, rather than
+    repeating each measurement back to back, keeps slow spells of a shared
+    machine from landing on every run of the same measurements, and the
+    median ignores both those spells and unusually fast ones.
+
+    Args:
+        matrix (dict): Lists of "sizes", "genes", "vertices" and "populations", SUITE_MATRIX by default.
+        repeats (int): Passes over the matrix; the median of each measurement is kept.
+        num_generations (int): Generations per full-generation run.
+        seed (int): Seed for the targets and the random streams.
+        min_time (float): Least seconds per measurement and pass: fast calls
+            are repeated, and full-generation runs are added, until then.
+
+    Returns:
+        (dict): "meta" (environment and settings) and "results", seconds per
+        operation keyed by operation and configuration.
+    """
+    matrix = matrix if matrix else SUITE_MATRIX
+    passes = {}
+    for _ in range(repeats):
+        for key, seconds in suite_pass(matrix, num_generations, seed, min_time).items():
+            passes.setdefault(key, []).append(seconds)
+    results = {key: float(np.median(seconds)) for key, seconds in passes.items()}
+
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeats": repeats,
+        "min_time": min_time,
+        "num_generations": num_generations,
+        "seed": seed,
+    }
+    return {"meta": meta, "results": results}
+
+def compare(results, baseline, tolerance=.25, noise_floor=2e-5, relative=True):
+    """
+    Compares suite results with a stored baseline.
+
+    On a shared machine the whole suite can run uniformly faster or slower
+    from one run to the next. With relative set, the median ratio of all
+    measurements is taken as that change in machine speed, and each ratio
+    is divided by it before it is checked, so that only measurements that
+    slowed down against the rest of the suite are reported. A change that
+    slows most of the suite equally shows up in the median instead.
+
+    Args:
+        results (dict): Output of run_suite().
+        baseline (dict): An earlier output of run_suite().
+        tolerance (float): Allowed slowdown before a measurement counts as a regression.
+        noise_floor (float): Seconds a measurement must also slow down by to
+            count, so that microsecond jitter is not reported.
+        relative (bool): Check ratios against the median ratio rather than 1.
+
+    Returns:
+        (tuple): The rows, (key, baseline seconds, new seconds, ratio,
+        regressed) for every measurement present in both, slowest ratio
+        first, and the median ratio the rows were checked against.
+    """
+    pairs = [(key, baseline["results"][key], seconds) for key, seconds in results["results"].items()
+             if baseline["results"].get(key)]
+    ratios = [seconds / before for _, before, seconds in pairs]
+    speed = float(np.median(ratios)) if relative and pairs else 1.0
+
+    rows = []
+    for (key, before, seconds), ratio in zip(pairs, ratios):
+        regressed = ratio / speed > 1 + tolerance and seconds / speed - before > noise_floor
+        rows.append((key, before, seconds, ratio, regressed))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows, speed
+
+def print_tables():
+    """
+    Prints the comparison tables of the individual benchmarks.
+    """
+    print(f"{'size':>12} {'genes':>6} {'verts':>6} {'pillow ms':>10} {'inplace ms':>10} {'speedup':>8} {'diff px':>8}")
+    for size in [(100, 100), (320, 180), (1280, 720)]:
+        for num_genes in [10, 50]:
+            for num_vertices in [3, 6]:
+                r = benchmark_renderers(size, num_genes, num_vertices)
+                print(f"{size[0]:>5}x{size[1]:<6} {num_genes:>6} {num_vertices:>6} "
+                      f"{r['pillow'] * 1e3:>10.2f} {r['inplace'] * 1e3:>10.2f} "
+                      f"{r['pillow'] / r['inplace']:>8.2f} {r['differing_pixels']:>8.2%}")
+
+    print()
+    print(f"{'size':>12} " + " ".join(f"{name + ' ms':>11}" for name in METRICS))
+    for size in [(160, 120), (320, 240), (1280, 720)]:
+        r = benchmark_metrics(synthetic_target(size))
+        print(f"{size[0]:>5}x{size[1]:<6} " + " ".join(f"{r[name] * 1e3:>11.2f}" for name in METRICS))
+
+    print()
+    print(f"{'genes':>6} {'method':>9} {'ms/gen':>8} {'blocks/gen':>11} {'KiB/gen':>8}")
+    for num_genes in [10, 50, 200]:
+        for name, r in benchmark_cloning(num_genes).items():
+            print(f"{num_genes:>6} {name:>9} {r['seconds'] * 1e3:>8.2f} {r['blocks']:>11} {r['bytes'] / 1024:>8.1f}")
+
+    print()
+    print(f"{'genes':>6} {'objects ms':>11} {'arrays ms':>10} {'speedup':>8}")
+    for num_genes in [10, 50, 200]:
+        r = benchmark_mutation(num_genes)
+        print(f"{num_genes:>6} {r['objects'] * 1e3:>11.2f} {r['arrays'] * 1e3:>10.2f} {r['objects'] / r['arrays']:>8.2f}")
+
+    print()
+    image = Image.open("./majesticUnicorn_smoll.png")
+    thresholds = [5000, 4000, 3500, 3200]
+    print(f"{'MSE':>6} {'full s':>8} {'pyramid s':>10} {'saved':>7}")
+    for mse, full, coarse in zip(thresholds, *(r.values() for r in benchmark_pyramid(image, thresholds, schedule=[150, 150]).values())):
+        saved = f"{1 - coarse / full:>7.0%}" if full and coarse else f"{'-':>7}"
+        print(f"{mse:>6} {full or float('nan'):>8.2f} {coarse or float('nan'):>10.2f} {saved}")
+
+    print()
+    image = Image.open("./majesticUnicorn_smoll.png").resize((1280, 720))
+    samples = [FitnessSample(.1, "pixels", seed=0), FitnessSample(.1, "rows", seed=0), FitnessSample(.05, "rows", seed=0)]
+    results = benchmark_sampling(image, samples)
+    print(f"full: {results['full'] * 1e3:.0f} ms/gen")
+    print(f"{'mode':>7} {'fraction':>9} {'score ms':>9} {'speedup':>8} {'confirmed':>10} {'confirm ms':>11}")
+    for i, sample in enumerate(samples):
+        r = results[i]
+        print(f"{sample.mode:>7} {sample.fraction:>9.0%} {r['score'] * 1e3:>9.0f} {results['full'] / r['score']:>8.1f} "
+              f"{r['confirmed']:>10} {r['confirm'] * 1e3:>11.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of version 2.")
+    parser.add_argument("--suite", action="store_true", help="run the timing suite instead of the comparison tables")
+    parser.add_argument("--quick", action="store_true", help="run the suite on a small matrix")
+    parser.add_argument("--output", help="write the suite results to this JSON file")
+    parser.add_argument("--baseline", help="compare the suite results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--repeats", type=int, default=6, help="passes over the suite, each measurement keeps its median")
+    parser.add_argument("--min-time", type=float, default=.1,
+                        help="least seconds per run of a measurement (fast calls are repeated until then)")
+    parser.add_argument("--noise-floor", type=float, default=2e-5,
+                        help="least slowdown in seconds that counts as a regression")
+    parser.add_argument("--absolute", action="store_true",
+                        help="check ratios against 1 instead of the median ratio of the suite")
+    args = parser.parse_args()
+
+    if not args.suite:
+        print_tables()
+        sys.exit(0)
+
+    suite = run_suite(QUICK_MATRIX if args.quick else SUITE_MATRIX, repeats=args.repeats, min_time=args.min_time)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(suite, file, indent=1)
+
+    if not args.baseline:
+        for key, seconds in suite["results"].items():
+            print(f"{seconds * 1e3:>10.3f} ms  {key}")
+        sys.exit(0)
+
+    with open(args.baseline) as file:
+        rows, speed = compare(suite, json.load(file), args.tolerance, args.noise_floor, not args.absolute)
+    print(f"{'baseline ms':>12} {'now ms':>10} {'ratio':>6}")
+    for key, before, seconds, ratio, regressed in rows:
+        print(f"{before * 1e3:>12.3f} {seconds * 1e3:>10.3f} {ratio:>6.2f}  {key}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(row[4] for row in rows)
+    reference = "the baseline" if args.absolute else f"the median ratio ({speed:.2f})"
+    print(f"{regressions} of {len(rows)} measurements slower than {reference} by more than {args.tolerance:.0%}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,103 @@
+"""
+check_geometry.py
+
+Checks geometry.py against Shapely on a randomized corpus of integer
+polygons: validity, centroids and clockwise ordering, both the batched
+functions (on geometry.pad() arrays) and the single-polygon ones. The
+reference implementations are the Shapely code Gene used before
+geometry.py replaced it.
+
+Shapely is not a dependency of the project; install it to run the check.
+
+Run from the repository root:
+    python -m version_2.check_geometry
+    python -m version_2.check_geometry --count 100000 --seed 7
+
+Exits with status 1 if any polygon disagrees.
+"""
+
+import argparse
+import math
+import sys
+import numpy as np
+from version_2 import geometry
+
+def random_polygons(count, rng):
+    """
+    A corpus of vertex lists with 3 to 8 vertices. Small coordinate ranges
+    make touching edges, collinear and repeated vertices and zero areas
+    common; large ones give ordinary gene-sized shapes.
+    """
+    polygons = []
+    for _ in range(count):
+        num_vertices = int(rng.integers(3, 9))
+        extent = int(rng.choice([3, 6, 20, 1000]))
+        points = rng.integers(0, extent, size=(num_vertices, 2)).tolist()
+        if rng.random() < .1: # repeat a vertex in place
+            i = int(rng.integers(num_vertices))
+            points.insert(i, list(points[i]))
+        polygons.append([tuple(point) for point in points])
+    return polygons
+
+def shapely_valid(polygon):
+    shape = Polygon(polygon)
+    return shape.is_simple and shape.is_valid
+
+def shapely_order_cw(polygon):
+    shape = Polygon(polygon)
+    cx, cy = shape.centroid.x, shape.centroid.y
+    return sorted(polygon, key=lambda p: math.atan2(p[1] - cy, p[0] - cx), reverse=True)
+
+def check(polygons):
+    """
+    Compares every polygon of the corpus.
+
+    Returns:
+        (dict): Number of mismatches per test.
+    """
+    points, counts = geometry.pad(polygons)
+    valid = geometry.valid_shapes(points, counts)
+    with np.errstate(divide="ignore", invalid="ignore"): # zero-area polygons have no centroid
+        cx, cy = geometry.centroids(points, counts)
+    has_area = ~geometry.zero_areas(points, counts)
+    ordered = geometry.order_clockwise(points[has_area], counts[has_area])
+
+    mismatches = {"valid_shapes": 0, "valid_shape": 0, "centroids": 0, "centroid": 0,
+                  "order_clockwise": 0, "order_cw": 0}
+    k = 0
+    for i, polygon in enumerate(polygons):
+        expected = shapely_valid(polygon)
+        mismatches["valid_shapes"] += bool(valid[i]) != expected
+        mismatches["valid_shape"] += geometry.valid_shape(polygon) != expected
+        if not has_area[i]:
+            continue
+
+        centroid = Polygon(polygon).centroid
+        mismatches["centroids"] += (cx[i], cy[i]) != (centroid.x, centroid.y)
+        mismatches["centroid"] += geometry.centroid(polygon) != (centroid.x, centroid.y)
+
+        expected = shapely_order_cw(polygon)
+        mismatches["order_clockwise"] += [tuple(p) for p in ordered[k, :len(polygon)].tolist()] != expected
+        mismatches["order_cw"] += geometry.order_cw(polygon) != expected
+        k += 1
+    return mismatches
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks geometry.py against Shapely.")
+    parser.add_argument("--count", type=int, default=20000, help="polygons in the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the corpus")
+    args = parser.parse_args()
+
+    try:
+        from shapely.geometry import Polygon
+    except ImportError:
+        print("Shapely is not installed (pip install shapely)")
+        sys.exit(2)
+
+    polygons = random_polygons(args.count, np.random.default_rng(args.seed))
+    mismatches = check(polygons)
+    num_valid = int(geometry.valid_shapes(*geometry.pad(polygons)).sum())
+    print(f"{len(polygons)} polygons, {num_valid} valid")
+    for name, count in mismatches.items():
+        print(f"{count:>8} mismatches  {name}")
+    sys.exit(1 if any(mismatches.values()) else 0)
@@ -0,0 +1,111 @@
+"""
+checkpoint.py
+
+Periodic checkpoints of a run, so that GeneticAlgorithm.resume() can pick
+it up where it stopped and continue exactly as the original run would have.
+
+A checkpoint holds:
+    - the elite's genome (genome_format.py) and fitness
+    - the number of generations completed
+    - the state of the run's np.random.Generator, which drives mutation
+    - the hyperparameters of the run
+    - the stats history
+    - the pyramid level and sampled-fitness state, when those are used
+
+The state is captured between generations (cheap: a few small copies) and
+pickled and written on a background thread. Files are written to a
+temporary name and renamed over the previous checkpoint, so a checkpoint
+on disk is always complete.
+
+The state is plain data only: dicts, lists, tuples, strings, numbers,
+bytes and NumPy arrays (the genome is in the genome_format.py encoding,
+the stats a structured array). No class of this package is pickled, so
+renaming classes or attributes does not break resuming, and load() refuses
+any pickle that refers to other classes.
+
+NOTES:
+    - retained generations are not saved; a resumed run starts with none
+    - the thread and error handling are BackgroundWriter's
+      (background_writer.py): a failed write is raised from the next
+      submit() or close()
+"""
+
+import os
+import pickle
+from version_2.background_writer import BackgroundWriter
+
+FORMAT_VERSION = 5 # 2: genome_format version 1, 3: stats as a record array, 4: NumPy random state, 5: plain data only
+
+# the only globals a checkpoint may refer to: what NumPy needs to rebuild arrays and scalars
+NUMPY_GLOBALS = ("_reconstruct", "_frombuffer", "ndarray", "dtype", "scalar")
+
+class Checkpointer(BackgroundWriter):
+    """
+    Writes the latest checkpoint of a run on a background thread.
+    """
+
+    name = "checkpoint-writer"
+
+    def __init__(self, path="./polyevolve_checkpoint.pkl", every=100):
+        """
+        Args:
+            path (str): File the checkpoint is written to (replaced each time).
+            every (int): Generations between checkpoints.
+        """
+        self.path = path
+        self.every = every
+        super().__init__(queue_size=1)
+
+    def wants(self, generation):
+        """
+        Whether to checkpoint after a generation (numbered from 1).
+        """
+        return self.every > 0 and generation % self.every == 0
+
+    def submit(self, state):
+        """
+        Queues a checkpoint. If the previous one is still waiting, it is
+        replaced: only the latest checkpoint matters.
+
+        Args:
+            state (dict): The captured run state, see GeneticAlgorithm.checkpoint_state().
+        """
+        self.start()
+        self.replace(state)
+
+    def write(self, state):
+        """
+        Writes one checkpoint atomically.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as file:
+            pickle.dump(dict(state, format_version=FORMAT_VERSION), file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+class CheckpointUnpickler(pickle.Unpickler):
+    """
+    Unpickles plain data and NumPy arrays only.
+    """
+
+    def find_class(self, module, name):
+        if module.split(".")[0] == "numpy" and name in NUMPY_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"A checkpoint cannot refer to {module}.{name}")
+
+def load(path):
+    """
+    Reads a checkpoint written by a Checkpointer.
+
+    Returns:
+        (dict): The run state.
+    """
+    with open(path, "rb") as file:
+        state = CheckpointUnpickler(file).load()
+    if state.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {state.get('format_version')}")
+    return state
@@ -0,0 +1,236 @@
+"""
+color_solver.py
+
+Closed-form polygon colors. Blending is affine, so the final image is
+affine in the color c of any one polygon. A polygon blended at alpha a
+over the canvas u of the genes below it gives ((255 - a) * u + a * c) / 255,
+and the genes above then turn a pixel value x into p + q * x, where q is
+the product of their (1 - alpha / 255) and p what they add. For a fixed
+alpha, the squared error against the target t is a quadratic in c,
+minimized per channel by
+
+    c = sum(q * r) / sum(q * q * a / 255),   r = t - p - q * (255 - a) * u / 255
+
+over the pixels the polygon covers (then clipped to [0, 255]).
+
+When no gene above overlaps the polygon (q = 1, p = 0), as for a gene on
+top, this is c = (255 * sum(t) - (255 - a) * sum(u)) / (a * n). Those sums
+are read from row prefix sums along the polygon's scanline spans: the
+target's are computed once, the canvas' only over the bounding box.
+
+A ColorSolver can:
+    - solve the color of one gene of an Individual, rendering only its
+      bounding box (the "solve color" mutation, see Individual.mutate())
+    - refine every gene of an Individual bottom-up in one render pass
+
+NOTES:
+    - the layers above are composited in floating point and the result is
+      rounded, so a solved color can be a step away from the best integer one
+    - the color minimizes MSE, whatever fitness metric the run uses;
+      genetic_algorithm.py keeps a refinement only if it scores better
+"""
+
+import numpy as np
+from version_2 import rasterizer
+
+class ColorSolver:
+    """
+    Computes MSE-optimal polygon colors against a target.
+    """
+
+    def __init__(self, target, background=(0, 0, 0), cache_size=4096):
+        """
+        Args:
+            target (Target): The prepared target image.
+            background (tuple): RGB background the genes are drawn on.
+            cache_size (int): Coverage masks kept before the cache is cleared.
+        """
+        self.target = target
+        self.background = background
+        self.prefix = row_prefix_sums(target.planes) # (3, height, width + 1), computed once
+        self.num_solved = 0
+
+        # coverage per vertex list: genes replace their vertex list rather than changing it,
+        # and clones share genes, so the masks of unchanged genes are computed once
+        self.coverages = {}
+        self.cache_size = cache_size
+
+    def coverage(self, gene):
+        """
+        The gene's (box, mask) on the target, or None if it covers nothing.
+        """
+        key = id(gene.vertices)
+        cached = self.coverages.get(key)
+        if cached is not None and cached[0] is gene.vertices:
+            return cached[1]
+
+        box = rasterizer.polygon_bbox(gene.vertices, *self.target.size)
+        coverage = None
+        if box is not None:
+            mask = rasterizer.polygon_mask(gene.vertices, box)
+            coverage = (box, mask) if mask.any() else None
+
+        if len(self.coverages) >= self.cache_size:
+            self.coverages.clear()
+        self.coverages[key] = (gene.vertices, coverage) # the list is kept so its id is not reused
+        return coverage
+
+    def optimal_color(self, genes, index, under):
+        """
+        The RGB color of genes[index] minimizing the squared error of the
+        whole image, at the gene's alpha.
+
+        Args:
+            genes (list): The genome.
+            index (int): The gene to solve.
+            under (ndarray): (3, box height, box width) canvas of the genes
+                below, over the gene's box.
+
+        Returns:
+            (tuple): (red, green, blue), or None if the gene covers nothing
+            or is fully transparent.
+        """
+        alpha = genes[index].color[3]
+        coverage = self.coverage(genes[index])
+        if coverage is None or alpha == 0:
+            return None
+        (x0, y0, x1, y1), mask = coverage
+
+        # what the genes above do to the covered pixels: x -> offset + transmittance * x
+        covered = np.flatnonzero(mask)
+        offset = transmittance = None
+        for gene in genes[index + 1:]:
+            hit = self.overlap(gene, (x0, y0, x1, y1))
+            if hit is None or gene.color[3] == 0:
+                continue
+            hit = hit.ravel()[covered]
+            if not hit.any():
+                continue
+            if offset is None:
+                offset = np.zeros((3, len(covered)))
+                transmittance = np.ones(len(covered))
+            opacity = hit * (gene.color[3] / 255)
+            offset += opacity * (np.asarray(gene.color[:3], dtype=np.float64)[:, None] - offset)
+            transmittance -= opacity * transmittance
+
+        if offset is None:
+            # nothing on top: two sums per channel, from prefix sums over the spans
+            rows, starts, ends = spans(mask)
+            target_sums = span_sums(self.prefix, rows + y0, starts + x0, ends + x0)
+            under_sums = span_sums(row_prefix_sums(under), rows, starts, ends)
+            color = (255 * target_sums - (255 - alpha) * under_sums) / (alpha * len(covered))
+        else:
+            q = transmittance
+            if not q.any(): # hidden under opaque genes
+                return None
+            residual = (self.target.planes[:, y0:y1, x0:x1].reshape(3, -1)[:, covered] - offset
+                        - q * ((255 - alpha) / 255) * under.reshape(3, -1)[:, covered])
+            color = (residual @ q) / ((alpha / 255) * (q @ q))
+
+        self.num_solved += 1
+        return tuple(int(c) for c in np.clip(np.rint(color), 0, 255))
+
+    def overlap(self, gene, box):
+        """
+        The gene's coverage over a box, as a mask of the box's shape, or
+        None if it does not reach the box.
+        """
+        coverage = self.coverage(gene)
+        if coverage is None:
+            return None
+        x0, y0, x1, y1 = box
+        (bx0, by0, bx1, by1), mask = coverage
+        ix0, iy0, ix1, iy1 = max(x0, bx0), max(y0, by0), min(x1, bx1), min(y1, by1)
+        if ix0 >= ix1 or iy0 >= iy1:
+            return None
+        hit = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        hit[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = mask[iy0 - by0:iy1 - by0, ix0 - bx0:ix1 - bx0]
+        return hit
+
+    def render_box(self, genes, box):
+        """
+        rasterizer.render_region() as a canvas, from the cached coverage masks.
+        """
+        x0, y0, x1, y1 = box
+        canvas = rasterizer.new_canvas((x1 - x0, y1 - y0), self.background)
+        for gene in genes:
+            hit = self.overlap(gene, box)
+            if hit is not None:
+                rasterizer.composite(canvas, hit, gene.color, (0, 0, x1 - x0, y1 - y0))
+        return canvas
+
+    def solve_gene(self, individual, index):
+        """
+        Sets the color of one gene to its optimal color, rendering the genes
+        below it only inside its bounding box. The gene must not be shared
+        with other individuals (see Gene.copy()).
+        """
+        gene = individual.genome[index]
+        coverage = self.coverage(gene)
+        if coverage is None:
+            return
+        under = self.render_box(individual.genome[:index], coverage[0])
+        color = self.optimal_color(individual.genome, index, under)
+        if color is not None:
+            gene.color = color + (gene.color[3],)
+
+    def refine(self, individual):
+        """
+        Solves the color of every gene, bottom-up, each against the canvas
+        of the (already refined) genes below it.
+
+        Returns:
+            (Individual): A new, unscored Individual; genes whose color did
+            not change are shared with the original.
+        """
+        refined = individual.clone()
+        refined.fitness = -1
+        canvas = rasterizer.new_canvas(individual.size, self.background)
+        for index, gene in enumerate(refined.genome):
+            coverage = self.coverage(gene)
+            if coverage is None:
+                continue
+            (x0, y0, x1, y1), mask = coverage
+            color = self.optimal_color(refined.genome, index, canvas[:, y0:y1, x0:x1])
+            if color is not None and color != gene.color[:3]:
+                gene = gene.copy()
+                gene.color = color + (gene.color[3],)
+                refined.genome[index] = gene
+            rasterizer.composite(canvas, mask, gene.color, (x0, y0, x1, y1))
+        return refined
+
+def row_prefix_sums(planes):
+    """
+    Running sums along each row, with a leading zero column, so the sum of
+    columns [x0, x1) of row y is prefix[:, y, x1] - prefix[:, y, x0].
+
+    Args:
+        planes (ndarray): (3, height, width) image.
+
+    Returns:
+        (ndarray): (3, height, width + 1) int64 prefix sums.
+    """
+    prefix = np.zeros(planes.shape[:2] + (planes.shape[2] + 1,), dtype=np.int64)
+    np.cumsum(planes, axis=2, out=prefix[:, :, 1:])
+    return prefix
+
+def spans(mask):
+    """
+    The horizontal runs of a coverage mask.
+
+    Returns:
+        (tuple): rows, starts and (exclusive) ends of the runs, as arrays.
+    """
+    edges = np.diff(np.pad(mask.view(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends
+
+def span_sums(prefix, rows, starts, ends):
+    """
+    Per-channel sums over runs, read from row prefix sums.
+
+    Returns:
+        (ndarray): (3,) int64 sums.
+    """
+    return (prefix[:, rows, ends] - prefix[:, rows, starts]).sum(axis=1)
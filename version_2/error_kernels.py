@@ -0,0 +1,95 @@
+"""
+error_kernels.py
+
+Image error kernels that work directly on 8-bit pixel values (uint8
+renders, the rasterizer's uint16 canvases, or the int32 target) without
+widening whole frames to int32.
+
+The difference of two values in [0, 255] fits in int16, and its square
+(at most 65025) fits in uint16. So each kernel makes one pass that
+subtracts into an int16 scratch buffer, one in-place pass that squares
+(or takes the absolute value), and then sums with a uint64 accumulator.
+That is one reused buffer instead of the int32 copy, difference, square
+and channel sum of the plain NumPy expression. Sums are exact, so
+fitness values are bit-identical to the int32 computation.
+
+Metrics:
+    "ssd"       - sum of squared differences (the MSE fitness)
+    "sad"       - sum of absolute differences
+    "weighted"  - squared differences weighted per channel
+
+NOTES:
+    - inputs must hold values in [0, 255]; larger values would wrap in int16
+    - the scratch buffer is not shared between threads; make a kernel per
+      evaluator (worker processes each build their own)
+"""
+
+import numpy as np
+
+METRICS = ("ssd", "sad", "weighted")
+
+class ErrorKernel:
+    """
+    Computes one error metric between images, reusing a scratch buffer.
+    """
+
+    def __init__(self, size, metric="ssd", weights=None):
+        """
+        Args:
+            size (tuple): (width, height) of the largest frame compared; the
+                scratch holds width * height * 3 values and grows if needed.
+            metric (str): "ssd", "sad" or "weighted".
+            weights (tuple): Per-channel weights for "weighted".
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown error metric: {metric}")
+        if metric == "weighted" and (weights is None or len(weights) != 3):
+            raise ValueError("The weighted metric needs three channel weights")
+
+        self.metric = metric
+        self.weights = tuple(float(w) for w in weights) if weights is not None else None
+        self.scratch = np.empty(size[0] * size[1] * 3, dtype=np.int16)
+
+    def buffer(self, shape):
+        """
+        A view of the scratch buffer with the given shape.
+        """
+        count = int(np.prod(shape))
+        if count > self.scratch.size:
+            self.scratch = np.empty(count, dtype=np.int16)
+        return self.scratch[:count].reshape(shape)
+
+    def error(self, a, b):
+        """
+        Total error between two arrays of the same shape.
+
+        Args:
+            a (ndarray): Pixel values in [0, 255], any integer dtype.
+            b (ndarray): Pixel values in [0, 255], any integer dtype.
+
+        Returns:
+            The error: an int for "ssd" and "sad", a float for "weighted".
+        """
+        diff = self.buffer(a.shape)
+        np.subtract(a, b, out=diff, dtype=np.int16, casting="unsafe")
+
+        if self.metric == "sad":
+            np.abs(diff, out=diff)
+            return int(diff.sum(dtype=np.int64))
+
+        np.multiply(diff, diff, out=diff) # wraps to negative int16, read back as uint16 below
+        squared = diff.view(np.uint16)
+        if self.metric == "ssd":
+            return int(squared.sum(dtype=np.uint64))
+
+        # summing each channel's strided view is much faster than a sum over two axes
+        channels = np.moveaxis(squared, -1, 0)
+        return sum(weight * int(channel.sum(dtype=np.uint64)) for weight, channel in zip(self.weights, channels))
+
+    def mean_error(self, a, b):
+        """
+        Error per pixel: the total error over the number of pixels (the
+        channels of a pixel count once). For "ssd" this is the MSE.
+        """
+        num_pixels = a.size // 3
+        return self.error(a, b) / num_pixels
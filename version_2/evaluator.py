@@ -0,0 +1,580 @@
+"""
+evaluator.py
+
+Evaluators score the candidates of a generation for genetic_algorithm.py.
+
+    - Evaluator scores them one at a time in this process.
+    - ProcessPoolEvaluator sends them to a persistent pool of worker
+      processes. The target is placed once in shared memory, genomes travel
+      in the compact form of genome_format.py and only scores come back.
+    - SampledEvaluator scores them on a sample of the target (see
+      sampling.py) and confirms only the promising ones in full.
+
+The first two return the same scores in the same order, whatever the number
+of workers or the order in which the workers finish.
+"""
+
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from version_2 import genome_format, rasterizer
+from version_2.metrics import KERNEL_METRICS, make_metric
+from version_2.image_renderer import ImageRenderer
+from version_2.incremental_renderer import IncrementalRenderer
+from version_2.sampling import FitnessSample
+from version_2.target import Target
+
+MAX_POSSIBLE_MSE = 195075 # 3 * 255^2
+REJECTED = -np.inf # fitness of a candidate early exit stopped scoring; left out of the stats (see stats.py)
+
+class Evaluator:
+    """
+    Scores candidates serially.
+    """
+
+    def __init__(self, target, render_backend="pillow", incremental=False, early_exit=False, band_height=16,
+                 metric="ssd", weights=None):
+        """
+        Args:
+            target (Target): The prepared target image.
+            render_backend (str): The rendering backend, "pillow" or "inplace".
+            incremental (bool): Re-render only the region mutation changed.
+            early_exit (bool): Accumulate error band by band and stop once a
+                candidate is certainly worse than the elite.
+            band_height (int): Rows per band for early exit.
+            metric (str): Fitness metric of metrics.py; "ssd" gives MSE fitness.
+            weights (tuple): Per-channel weights for the "weighted" metric.
+        """
+        if incremental and early_exit:
+            raise ValueError("Early exit applies to full renders, not incremental ones")
+        if metric != "ssd" and (incremental or early_exit):
+            raise ValueError("Incremental rendering and early exit measure squared error only")
+
+        self.target = target
+        self.renderer = ImageRenderer(backend=render_backend)
+        self.incremental_renderer = IncrementalRenderer(target) if incremental else None
+        self.metric = make_metric(metric, target, weights) # target features are computed here, once
+        self.kernel = self.metric.kernel if metric in KERNEL_METRICS else None # RGB error kernel, if the metric has one
+        self.max_error = self.metric.max_error
+
+        # early exit: bands of rows, the elite's error per band, and bands scored per candidate
+        self.early_exit = early_exit
+        height = target.size[1]
+        self.bands = [(y0, min(y0 + band_height, height)) for y0 in range(0, height, band_height)]
+        self.band_height = band_height
+        self.elite_error = None # elite's summed squared error, None while no candidate can be rejected
+        self.elite_band_errors = None # elite's squared error per band
+        self.band_rank = None # band indices, largest elite error first
+        self.bands_processed = 0 # bands scored for the last candidate
+        self.band_counts = [] # bands scored per candidate in the last evaluate()
+        self.num_rejected = 0 # candidates dropped before their last band
+
+        # renders kept so snapshots do not render the elite again
+        self.best_render = None # (individual, pixels) of the best candidate of the last evaluate()
+        self.elite_render = None # (individual, pixels) of the elite, if known
+        self.last_pixels = None # pixels of the last full render
+
+        # [render, error] seconds of fitness_mse(), accumulated while instrumented (see instrumentation.py)
+        self.phase_times = None
+
+    def set_elite(self, individual):
+        """
+        Tells the evaluator which individual the next candidates are cloned from.
+        """
+        if self.incremental_renderer:
+            self.incremental_renderer.set_elite(individual)
+            self.elite_render = (individual, self.incremental_renderer.pixels)
+        elif self.best_render and self.best_render[0] is individual:
+            self.elite_render = self.best_render
+        else:
+            self.elite_render = None
+
+        if self.early_exit:
+            self.set_elite_bands(individual)
+
+    def set_elite_bands(self, individual):
+        """
+        Measures the elite's error per band, the bar candidates must clear.
+        An elite that has not been scored yet (fitness -1) rejects nothing.
+        """
+        if individual.fitness < 0:
+            self.elite_error = None
+            return
+
+        pixels = self.elite_render[1] if self.elite_render else None
+        if pixels is None:
+            pixels = self.renderer.render_array(individual)
+        squared_error = ((pixels.astype(self.target.dtype) - self.target.pixels) ** 2).sum(axis=(1, 2), dtype=np.int64)
+
+        band_errors = np.add.reduceat(squared_error, [y0 for y0, _ in self.bands])
+        self.elite_error = int(band_errors.sum())
+        self.elite_band_errors = band_errors.tolist()
+        self.band_rank = np.argsort(-band_errors, kind="stable").tolist()
+
+    def rendered(self, individual):
+        """
+        The (height, width, 3) uint8 image of the elite, if this evaluator
+        already rendered it, otherwise None.
+        """
+        if self.elite_render is None or self.elite_render[0] is not individual:
+            return None
+        return self.elite_render[1]
+
+    def evaluate(self, individuals):
+        """
+        Scores a sequence of candidates produced by reproduce().
+
+        Returns:
+            (list): The fitness scores, in the order of the candidates.
+        """
+        scores = []
+        best_score = None
+        self.best_render = None
+        self.band_counts = []
+        for individual in individuals:
+            score = self.fitness(individual)
+            if best_score is None or score > best_score:
+                best_score = score
+                self.best_render = (individual, self.last_pixels) if self.last_pixels is not None else None
+            self.last_pixels = None
+            scores.append(score)
+            if self.early_exit:
+                self.band_counts.append(self.bands_processed)
+        return scores
+
+    def evaluate_arrays(self, arrays):
+        """
+        Scores every member of a GenerationArrays with full renders, drawn
+        straight from the arrays without building Individuals. Renders
+        match render_array() with either backend.
+
+        Returns:
+            (ndarray): The fitness scores, in member order.
+        """
+        scores = np.empty(arrays.population_size)
+        for p in range(arrays.population_size):
+            start = time.perf_counter()
+            pixels = rasterizer.render_arrays(arrays.size, arrays.vertices[p], arrays.counts[p], arrays.colors[p])
+            rendered = time.perf_counter()
+            scores[p] = self.max_error - self.metric.error(pixels)
+            if self.phase_times is not None:
+                self.phase_times[0] += rendered - start
+                self.phase_times[1] += time.perf_counter() - rendered
+        return scores
+
+    def fitness(self, individual):
+        """
+        Scores one candidate, incrementally if enabled.
+        """
+        if self.incremental_renderer:
+            return self.fitness_incremental(individual)
+        if self.early_exit:
+            return self.fitness_early_exit(individual)
+        return self.fitness_mse(individual)
+
+    def fitness_mse(self, individual):
+        """
+        Fitness of a fully rendered individual (higher is better): MSE
+        fitness, or the chosen metric's max_error - error.
+        """
+        if self.phase_times is None:
+            self.last_pixels = self.renderer.render_array(individual)
+            error = self.metric.error(self.last_pixels)
+        else:
+            start = time.perf_counter()
+            self.last_pixels = self.renderer.render_array(individual)
+            rendered = time.perf_counter()
+            error = self.metric.error(self.last_pixels)
+            self.phase_times[0] += rendered - start
+            self.phase_times[1] += time.perf_counter() - rendered
+        assert error >= 0, "Error must be non-negative"
+        return self.max_error - error
+
+    def fitness_early_exit(self, individual):
+        """
+        MSE fitness of a mutated clone of the elite, accumulated band by band.
+
+        A clone only differs from the elite inside its dirty box, so every
+        other band is credited with the elite's error for that band without
+        being diffed (or, with the inplace backend, rendered). The dirty bands
+        are scored largest elite error first, stopping once the total
+        exceeds the elite's error.
+
+        A candidate that survives every band gets its exact fitness. A
+        rejected one gets REJECTED rather than a partial score: it is never
+        selected, and StatsHistory leaves it out of the generation's
+        min/max/mean/std, which would otherwise mix bounds with fitnesses.
+        """
+        if self.elite_error is None or individual.dirty_box is None:
+            order = list(range(len(self.bands))) # no elite to compare with: score everything
+            squared_error = 0
+        else:
+            _, top, _, bottom = individual.dirty_box
+            first = max(top, 0) // self.band_height
+            last = min(-(-bottom // self.band_height), len(self.bands))
+            order = [band for band in self.band_rank if first <= band < last]
+            squared_error = self.elite_error - sum(self.elite_band_errors[band] for band in order)
+
+        # the inplace backend renders just the rows of those bands, pillow renders everything
+        pixels = rows = None
+        top = 0
+        if self.renderer.backend == "inplace":
+            if order:
+                top, bottom = self.bands[min(order)][0], self.bands[max(order)][1]
+                rows = rasterizer.render_region((0, top, self.target.size[0], bottom), individual.genome)
+        else:
+            pixels = rows = self.renderer.render_array(individual)
+
+        self.bands_processed = 0
+        for band in order:
+            y0, y1 = self.bands[band]
+            squared_error += self.kernel.error(rows[y0 - top:y1 - top], self.target.pixels[y0:y1])
+            self.bands_processed += 1
+
+            if (self.elite_error is not None and squared_error > self.elite_error
+                    and self.bands_processed < len(order)):
+                self.num_rejected += 1
+                self.last_pixels = pixels
+                return REJECTED
+
+        self.last_pixels = pixels
+        return MAX_POSSIBLE_MSE - squared_error / self.target.num_pixels
+
+    def fitness_incremental(self, individual):
+        """
+        MSE fitness of a mutated clone of the elite. Only the clone's dirty
+        region is re-rendered and re-diffed; the elite's cached error is
+        updated by the difference.
+        """
+        squared_error = self.incremental_renderer.squared_error(individual)
+        return MAX_POSSIBLE_MSE - squared_error / self.target.num_pixels
+
+    def close(self):
+        pass
+
+class SampledEvaluator:
+    """
+    Scores candidates on a sample of the target. Candidates that beat the
+    elite on the sample are confirmed at full resolution by confirm().
+    """
+
+    def __init__(self, target, render_backend="pillow", sample=None, metric="ssd", weights=None):
+        """
+        Args:
+            target (Target): The prepared target image.
+            render_backend (str): The rendering backend, "pillow" or "inplace".
+            sample (FitnessSample): How the sample is drawn.
+            metric (str): Fitness metric of metrics.py, one of KERNEL_METRICS.
+            weights (tuple): Per-channel weights for the "weighted" metric.
+        """
+        if metric not in KERNEL_METRICS:
+            raise ValueError(f"Sampled fitness supports the per-pixel metrics {KERNEL_METRICS}")
+        self.target = target
+        self.sample = sample if sample else FitnessSample()
+        self.full = Evaluator(target, render_backend, metric=metric, weights=weights) # confirmations and audits
+        self.renderer = self.full.renderer
+
+        self.elite = None
+        self.elite_sample_fitness = None
+        self.drawn = None # flat pixel indices or rows of the current sample
+        self.sample_pixels = None # target pixels at the sampled indices (or rows)
+        self.generation = 0
+
+        # how often the sample misleads
+        self.num_evaluated = 0 # candidates scored on the sample
+        self.num_confirmed = 0 # candidates re-scored in full because they beat the elite on the sample
+        self.num_rejected = 0 # confirmed candidates that did not beat the elite in full
+        self.num_audited = 0 # candidates also scored in full by audits
+        self.num_missed = 0 # audited candidates that beat the elite in full but not on the sample
+        self.rank_disagreement = [] # per audit, fraction of candidate pairs ordered differently by the sample
+        self.pixels_compared = 0
+
+    def set_elite(self, individual):
+        """
+        Tells the evaluator which individual the candidates must beat.
+        """
+        self.elite = individual
+        self.full.set_elite(individual)
+        if self.drawn is not None:
+            self.elite_sample_fitness = self.sample_fitness(individual)
+
+    def rendered(self, individual):
+        return self.full.rendered(individual)
+
+    def evaluate(self, individuals):
+        """
+        Scores a sequence of candidates on the sample, drawing a new sample
+        first when the refresh interval says so.
+
+        Returns:
+            (list): The sampled fitness scores, in the order of the candidates.
+        """
+        refresh = self.sample.refresh
+        if self.drawn is None or (refresh and self.generation % refresh == 0):
+            self.draw()
+        self.generation += 1
+
+        scores = [self.sample_fitness(individual) for individual in individuals]
+        self.num_evaluated += len(scores)
+
+        if self.sample.audit_every and self.generation % self.sample.audit_every == 0:
+            self.audit(individuals, scores)
+        return scores
+
+    def draw(self):
+        """
+        Draws a new sample.
+        """
+        self.use_sample(self.sample.draw(self.target.size))
+
+    def use_sample(self, drawn):
+        """
+        Scores on the given sample from now on, re-scoring the elite on it.
+        """
+        self.drawn = drawn
+        if self.sample.mode == "pixels":
+            self.sample_pixels = self.target.pixels.reshape(-1, 3)[self.drawn]
+        else:
+            self.sample_pixels = self.target.pixels[self.drawn]
+        if self.elite is not None:
+            self.elite_sample_fitness = self.sample_fitness(self.elite)
+
+    def sample_fitness(self, individual):
+        """
+        MSE fitness of an individual measured on the sample only.
+        """
+        if self.sample.mode == "pixels":
+            pixels = self.renderer.render_array(individual).reshape(-1, 3)[self.drawn]
+            self.pixels_compared += len(self.drawn)
+            return self.full.max_error - self.full.kernel.mean_error(pixels, self.sample_pixels)
+
+        # the inplace backend renders the rows on their own; pillow renders in full, so that
+        # sample scores come from the same renders as confirm()'s full scores
+        if self.renderer.backend == "inplace":
+            rows = rasterizer.render_rows(self.target.size, self.drawn, individual.genome)
+        else:
+            rows = self.renderer.render_array(individual)[self.drawn]
+        error = self.full.kernel.error(rows, self.sample_pixels)
+        num_pixels = len(self.drawn) * self.target.size[0]
+        self.pixels_compared += num_pixels
+        return self.full.max_error - error / num_pixels
+
+    def confirm(self, candidates):
+        """
+        Re-scores at full resolution the candidates that beat the elite on
+        the sample, and sets their fitness to the full score.
+
+        Args:
+            candidates (list): Candidates ordered by sampled fitness, best first.
+
+        Returns:
+            (Individual): The best of them if it beats the elite in full, otherwise None.
+        """
+        promising = []
+        for individual in candidates:
+            if self.elite is not None and individual.fitness <= self.elite_sample_fitness:
+                break
+            promising.append(individual)
+        if not promising:
+            return None
+
+        scores = self.full.evaluate(promising) # keeps the render of the best for snapshots
+        for individual, score in zip(promising, scores):
+            individual.set_fitness(score)
+
+        elite_fitness = self.elite.fitness if self.elite is not None else -1
+        self.num_confirmed += len(promising)
+        self.num_rejected += sum(score <= elite_fitness for score in scores)
+
+        best = max(promising, key=lambda individual: individual.fitness)
+        return best if best.fitness > elite_fitness else None
+
+    def audit(self, individuals, scores):
+        """
+        Scores every candidate in full and records how the sample's ranking
+        differs from the full ranking.
+        """
+        sampled = np.asarray(scores)
+        full = np.array([self.full.fitness_mse(individual) for individual in individuals])
+        self.full.last_pixels = None
+
+        if self.elite is not None:
+            self.num_missed += int(np.sum((full > self.elite.fitness) & (sampled <= self.elite_sample_fitness)))
+        self.num_audited += len(full)
+
+        # discordant pairs: ordered one way by the sample and the other way in full
+        order = np.sign(sampled[:, None] - sampled[None, :]) * np.sign(full[:, None] - full[None, :])
+        num_pairs = len(full) * (len(full) - 1)
+        self.rank_disagreement.append(float(np.sum(order < 0) / num_pairs) if num_pairs else 0.0)
+
+    def state(self):
+        """
+        The state needed to continue sampling exactly, for checkpoints.
+        """
+        return {
+            "generation": self.generation,
+            "drawn": self.drawn,
+            "rng": self.sample.rng.bit_generator.state,
+            "counters": (self.num_evaluated, self.num_confirmed, self.num_rejected,
+                         self.num_audited, self.num_missed, list(self.rank_disagreement)),
+        }
+
+    def restore(self, state):
+        """
+        Continues from a state(), before set_elite() is called.
+        """
+        self.generation = state["generation"]
+        self.sample.rng.bit_generator.state = state["rng"]
+        (self.num_evaluated, self.num_confirmed, self.num_rejected,
+         self.num_audited, self.num_missed, self.rank_disagreement) = state["counters"]
+
+        if state["drawn"] is not None:
+            self.use_sample(state["drawn"])
+
+    def close(self):
+        pass
+
+class ProcessPoolEvaluator:
+    """
+    Scores candidates on a persistent pool of worker processes.
+    """
+
+    def __init__(self, target, render_backend="pillow", incremental=False, num_workers=2,
+                 early_exit=False, band_height=16, metric="ssd", weights=None):
+        """
+        Args:
+            target (Target): The prepared target image.
+            render_backend (str): The rendering backend, "pillow" or "inplace".
+            incremental (bool): Re-render only the region mutation changed.
+            num_workers (int): Number of worker processes.
+            early_exit (bool): Stop scoring candidates once they are certainly worse than the elite.
+            band_height (int): Rows per band for early exit.
+            metric (str): Fitness metric of metrics.py.
+            weights (tuple): Per-channel weights for the "weighted" metric.
+        """
+        if incremental and early_exit:
+            raise ValueError("Early exit applies to full renders, not incremental ones")
+        if metric != "ssd" and (incremental or early_exit):
+            raise ValueError("Incremental rendering and early exit measure squared error only")
+
+        self.size = target.size
+        self.num_workers = num_workers
+        self.incremental = incremental
+        self.early_exit = early_exit
+        self.band_counts = [] # bands scored per candidate in the last evaluate(), with early exit
+
+        # the elite is sent along with every chunk; workers re-render it only when the version changes
+        self.elite_version = 0
+        self.elite_data = None
+        self.elite_fitness = None
+
+        # place the target in shared memory once, instead of pickling it per task: the pixels
+        # followed by the planar layout, so no worker builds its own copy of either
+        pixels = target.pixels
+        self.shared_target = shared_memory.SharedMemory(create=True, size=2 * pixels.nbytes)
+        shared_pixels = np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=self.shared_target.buf)
+        shared_pixels[:] = pixels
+        shared_planes = np.ndarray(target.planes.shape, dtype=pixels.dtype, buffer=self.shared_target.buf,
+                                   offset=pixels.nbytes)
+        shared_planes[:] = target.planes
+
+        self.pool = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=init_worker,
+            initargs=(self.shared_target.name, pixels.shape, pixels.dtype.str, render_backend, incremental,
+                      early_exit, band_height, metric, weights),
+        )
+
+    def set_elite(self, individual):
+        """
+        Tells the evaluator which individual the next candidates are cloned from.
+        """
+        if self.incremental or self.early_exit:
+            self.elite_version += 1
+            self.elite_data = genome_format.encode(individual)
+            self.elite_fitness = individual.fitness # the packed genome does not carry it
+
+    def evaluate(self, individuals):
+        """
+        Scores a sequence of candidates produced by reproduce().
+
+        Returns:
+            (list): The fitness scores, in the order of the candidates.
+        """
+        candidates = [(genome_format.encode(ind), ind.dirty_box) for ind in individuals]
+
+        # one contiguous chunk per worker; map() returns chunks in submission order
+        chunk_size = -(-len(candidates) // self.num_workers)
+        chunks = [(self.elite_version, self.elite_data, self.elite_fitness, candidates[i:i + chunk_size])
+                  for i in range(0, len(candidates), chunk_size)]
+
+        scores = []
+        self.band_counts = []
+        for chunk_scores, chunk_bands in self.pool.map(score_chunk, chunks):
+            scores.extend(chunk_scores)
+            self.band_counts.extend(chunk_bands)
+        return scores
+
+    def rendered(self, individual):
+        """
+        Workers do not send renders back, so the elite is never available here.
+        """
+        return None
+
+    def close(self):
+        """
+        Shuts the pool down and frees the shared target.
+        """
+        self.pool.shutdown()
+        self.shared_target.close()
+        self.shared_target.unlink()
+
+# state of a worker process, set up once by init_worker()
+worker = {}
+
+def init_worker(shm_name, shape, dtype, render_backend, incremental, early_exit=False, band_height=16,
+                metric="ssd", weights=None):
+    """
+    Attaches a worker process to the shared target.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name) # the parent owns and unlinks the segment
+
+    pixels = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    planes = np.ndarray((shape[2], shape[0], shape[1]), dtype=pixels.dtype, buffer=shm.buf, offset=pixels.nbytes)
+    target = Target.from_pixels(pixels, dtype=pixels.dtype, planes=planes)
+
+    worker["shm"] = shm # keep the mapping alive
+    worker["evaluator"] = Evaluator(target, render_backend, incremental, early_exit, band_height, metric, weights)
+    worker["elite_version"] = None
+
+def score_chunk(chunk):
+    """
+    Scores a chunk of packed candidates in a worker process.
+
+    Args:
+        chunk (tuple): (elite version, packed elite, elite fitness, [(packed genome, dirty box), ...]).
+
+    Returns:
+        (tuple): The fitness scores in order, and the bands scored per
+        candidate (empty without early exit).
+    """
+    elite_version, elite_data, elite_fitness, candidates = chunk
+    evaluator = worker["evaluator"]
+    size = evaluator.target.size
+
+    if elite_data is not None and worker["elite_version"] != elite_version:
+        elite = genome_format.decode(elite_data, size)
+        elite.set_fitness(elite_fitness)
+        evaluator.set_elite(elite)
+        worker["elite_version"] = elite_version
+
+    scores = []
+    bands = []
+    for data, dirty_box in candidates:
+        individual = genome_format.decode(data, size)
+        individual.dirty_box = dirty_box
+        scores.append(evaluator.fitness(individual))
+        if evaluator.early_exit:
+            bands.append(evaluator.bands_processed)
+    return scores, bands
@@ -6,42 +6,64 @@ the points are randomly selected within the
 constraints provided (the dimensions of the target image to be approximated).
 
 NOTES:
-
+    - all randomness comes from the np.random.Generator passed in, so a
+      seeded run is reproducible
+    - random integers are drawn through random_ints(): a mutation needs a
+      handful at a time, where Generator.integers costs microseconds per call
 """
 
-from random import randint
-from shapely.geometry import Polygon
-import math
+from version_2 import geometry
+import copy
+
+def random_ints(rng, low, high, count):
+    """
+    Draws uniform random integers in [low, high] from one batch of floats.
+
+    Returns:
+        list: count Python ints.
+    """
+    span = high - low + 1
+    return [low + int(u * span) for u in rng.random(count).tolist()]
 
 class Gene:
     """
     Represents a polygon defined by a set of points and a color.
     """
 
-    def __init__(self, max_dims, vertices=None, color=None):
+    def __init__(self, max_dims, vertices=None, color=None, rng=None):
         """
         Args:
             max_dims (tuple): maximum coordinates where a polygon point may be placed.
             vertices (list): tuples defining the coordinates of polygon points.
             color (tuple): RGB value representing the color of the polygon.
+            rng (Generator): source of the random vertices and color, required when those are not given.
         """
         self.max_x = max_dims[0]
         self.max_y = max_dims[1]
-        self.num_vertices = 3
+        self.num_vertices = len(vertices) if vertices else 3
 
-        self.vertices = vertices if vertices else self.random_points()
-        self.color = color if color else self.random_color()
+        if rng is None and not (vertices and color):
+            raise ValueError("A random gene needs an rng; an unseeded one would make the run irreproducible")
+        self.vertices = vertices if vertices else self.random_points(rng)
+        self.color = color if color else self.random_color(rng)
 
         #self.sp
 
-    def random_points(self):
+    def copy(self):
+        """
+        Copy the gene. Mutations replace the vertex list and color tuple
+        rather than modifying them, so those can be shared with the original.
+        """
+        return copy.copy(self)
+
+    def random_points(self, rng):
         """
         Generate a set of random points. They must form a simple polygon.
         """
         while True:
             points = []
             for i in range(self.num_vertices):
-                points.append(self.random_point())
+                points.append(self.random_point(rng))
 
             if self.valid_shape(points):
                 break
@@ -50,20 +72,21 @@ class Gene:
 
         return points
 
-    def random_point(self):
+    def random_point(self, rng):
         """
         Create a random point within constraints.
 
         Returns:
             tuple: A point represented by x and y coordinates.
         """
-        x = randint(0, self.max_x)
-        y = randint(0, self.max_y)
+        u, v = rng.random(2).tolist()
+        x = int(u * (self.max_x + 1))
+        y = int(v * (self.max_y + 1))
 
         point = (x, y)
         return point
 
-    def add_vertex(self):
+    def add_vertex(self, rng):
         """
         Add a vertex to the polygon by taking the midpoint of two random
         adjacent vertices and perturbing it.
@@ -71,13 +94,13 @@ class Gene:
         attempts = 0
         #while True:
         while attempts < 100:
-            rand = randint(0, self.num_vertices - 2) # a little janky
+            rand = int(rng.random() * (self.num_vertices - 1)) # a little janky
             v1 = self.vertices[rand]
             v2 = self.vertices[rand+1]
 
             new_vertex = ((v1[0] + v2[0]) // 2, (v1[1] + v2[1]) // 2)
             perturb_radius = int(min(self.max_x, self.max_y) * .05)
-            new_vertex_perturbed = self.perturb_vertex(new_vertex, perturb_radius)
+            new_vertex_perturbed = self.perturb_vertex(new_vertex, perturb_radius, rng)
 
             new_vertices = self.vertices.copy()
             new_vertices.append(new_vertex_perturbed)
@@ -94,66 +117,65 @@ class Gene:
         """
         Check if the polygon is valid (non-zero area, no duplicate vertices) and simple.
         """
-        sp = Polygon(vertices) # a Shapely polygon
-
-        if sp.is_simple and sp.is_valid:
-            return True
-        else:
-            return False
+        return geometry.valid_shape(vertices)
 
     def order_cw(self, points):
         """
         Puts all the points in a clockwise order.
         """
-        sp = Polygon(points)
-        cx = sp.centroid.x
-        cy = sp.centroid.y
+        return geometry.order_cw(points)
 
-        def angle_about_centroid(point):
-            px, py = point
-            return math.atan2(py - cy, px - cx)
+    def bounding_box(self):
+        """
+        Get the box covering every vertex.
 
-        return sorted(points, key=angle_about_centroid, reverse=True)
+        Returns:
+            tuple: (x0, y0, x1, y1) in pixels, with exclusive ends.
+        """
+        xs = [v[0] for v in self.vertices]
+        ys = [v[1] for v in self.vertices]
+        return (min(xs), min(ys), max(xs) + 1, max(ys) + 1)
 
-    def random_color(self):
+    def random_color(self, rng):
         """
         Get random a random color.
         RGBA format is used with opacity fixed.
 
         Parameters:
-            (none)
+            rng (Generator): the random source.
 
         Returns:
             tuple: An RGBA color value.
         """
-        red = randint(0, 255)
-        green = randint(0, 255)
-        blue = randint(0, 255)
+        red, green, blue = random_ints(rng, 0, 255, 3)
         alpha = 60 # 255 is opaque
 
         rgba = (red, green, blue, alpha)
         return rgba
 
-    def perturb_vertices(self):
+    def perturb_vertices(self, rng):
         """
         Modifies the Polygon vertices to locations within a set
         distance (percentage of the min canvas dimension) of the original vertices.
         """
         perturb_radius = int(min(self.max_x, self.max_y) * .1)
 
+        # one draw for every offset of the polygon
+        offsets = random_ints(rng, -perturb_radius, perturb_radius, 2 * self.num_vertices)
+
         new_vertices = []
-        for i in range(self.num_vertices):
-            new_vertex = self.perturb_vertex(self.vertices[i], perturb_radius)
+        for (x, y), rand_x, rand_y in zip(self.vertices, offsets[0::2], offsets[1::2]):
+            new_vertex = (self.clamp(x + rand_x, 0, self.max_x),
+                          self.clamp(y + rand_y, 0, self.max_y))
             new_vertices.append(new_vertex)
 
         self.vertices = new_vertices
 
-    def perturb_vertex(self, vertex, radius):
+    def perturb_vertex(self, vertex, radius, rng):
         """
         Modifies a vertex to a location within a provided radius.
         """
-        rand_x = randint(-radius, radius)
-        rand_y = randint(-radius, radius)
+        rand_x, rand_y = random_ints(rng, -radius, radius, 2)
 
         x, y = vertex
         new_vertex = (self.clamp(x + rand_x, 0, self.max_x),
@@ -161,17 +183,18 @@ class Gene:
 
         return new_vertex
 
-    def perturb_color(self):
+    def perturb_color(self, rng):
         """
         Modifies the Polygon color to a random one within a set distance.
         """
         perturb_radius = 10
 
         r, g, b, a = self.color  # Unpack the existing RGBA tuple
+        rand_r, rand_g, rand_b = random_ints(rng, -perturb_radius, perturb_radius, 3)
 
-        new_r = self.wrap(r + randint(-perturb_radius, perturb_radius), 0, 255)
-        new_g = self.wrap(g + randint(-perturb_radius, perturb_radius), 0, 255)
-        new_b = self.wrap(b + randint(-perturb_radius, perturb_radius), 0, 255)
+        new_r = self.wrap(r + rand_r, 0, 255)
+        new_g = self.wrap(g + rand_g, 0, 255)
+        new_b = self.wrap(b + rand_b, 0, 255)
 
         self.color = (new_r, new_g, new_b, a)
 
@@ -18,21 +18,21 @@ class Generation:
     Represents a generation defined by a set Individuals.
     """
 
-    def __init__(self, individual_size, individuals, population_size=1000):
+    def __init__(self, individual_size, individuals, population_size=1000, rng=None):
         self.population_size = population_size
         self.population_fitness_score = -1 # average fitness
         self.individual_size = individual_size
 
-        self.population = individuals if individuals else self.random_individuals()
+        self.population = individuals if individuals else self.random_individuals(rng)
 
-    def random_individuals(self):
+    def random_individuals(self, rng=None):
         """
         Generates a random set of individuals.
         """
         new_individuals = []
 
         for i in range(self.population_size):
-            individual = Individual(self.individual_size)
+            individual = Individual(self.individual_size, rng=rng)
             new_individuals.append(individual)
 
         return new_individuals
@@ -0,0 +1,175 @@
+"""
+generation_arrays.py
+
+GenerationArrays stores a whole generation as a few NumPy arrays
+(struct-of-arrays) instead of Individual and Gene objects:
+
+    vertices    int32[population, genes, max_vertices, 2]   padded with zeros
+    counts      int32[population, genes]                     vertices in use
+    colors      uint8[population, genes, 4]                  RGBA
+    fitness     float64[population]
+
+Cloning and serialization are whole-array operations, and the rasterizer
+and evaluator can read the arrays directly. Adapters convert to and from
+Individuals, so the object-based code paths keep working.
+"""
+
+import io
+import numpy as np
+from version_2.gene import Gene
+from version_2.individual import Individual
+from version_2.generation import Generation
+
+class GenerationArrays:
+    """
+    Represents a generation of Individuals as padded NumPy arrays.
+    """
+
+    def __init__(self, size, vertices, counts, colors, fitness=None):
+        """
+        Args:
+            size (tuple): (width, height) of the canvas.
+            vertices (ndarray): (population, genes, max_vertices, 2) vertex coordinates.
+            counts (ndarray): (population, genes) number of vertices in use.
+            colors (ndarray): (population, genes, 4) RGBA colors.
+            fitness (ndarray): (population,) fitness scores, -1 if not evaluated.
+        """
+        self.size = tuple(size)
+        self.vertices = np.asarray(vertices, dtype=np.int32)
+        self.counts = np.asarray(counts, dtype=np.int32)
+        self.colors = np.asarray(colors, dtype=np.uint8)
+        if fitness is None:
+            fitness = np.full(len(self.counts), -1, dtype=np.float64)
+        self.fitness = np.asarray(fitness, dtype=np.float64)
+
+    @property
+    def population_size(self):
+        return self.counts.shape[0]
+
+    @property
+    def num_genes(self):
+        return self.counts.shape[1]
+
+    @property
+    def max_vertices(self):
+        return self.vertices.shape[2]
+
+    def __len__(self):
+        return self.population_size
+
+    @classmethod
+    def from_individuals(cls, individuals):
+        """
+        Packs Individuals (all with the same size and number of genes) into arrays.
+        """
+        size = individuals[0].size
+        num_genes = len(individuals[0].genome)
+        max_vertices = max(len(gene.vertices) for ind in individuals for gene in ind.genome)
+
+        vertices = np.zeros((len(individuals), num_genes, max_vertices, 2), dtype=np.int32)
+        counts = np.zeros((len(individuals), num_genes), dtype=np.int32)
+        colors = np.zeros((len(individuals), num_genes, 4), dtype=np.uint8)
+
+        for p, individual in enumerate(individuals):
+            for g, gene in enumerate(individual.genome):
+                n = len(gene.vertices)
+                vertices[p, g, :n] = gene.vertices
+                counts[p, g] = n
+                colors[p, g] = gene.color
+
+        fitness = [individual.fitness for individual in individuals]
+        return cls(size, vertices, counts, colors, fitness)
+
+    @classmethod
+    def from_generation(cls, generation):
+        return cls.from_individuals(generation.population)
+
+    @classmethod
+    def clones(cls, individual, population_size):
+        """
+        A generation of identical copies of one Individual, e.g. the elite,
+        with room for the vertex a mutation may add to each gene.
+        """
+        single = cls.from_individuals([individual])
+        single.ensure_capacity(single.max_vertices + 1)
+        return single.repeat(population_size)
+
+    def repeat(self, population_size):
+        """
+        Copies member 0 into a new generation of population_size members.
+        """
+        return GenerationArrays(
+            self.size,
+            np.repeat(self.vertices[:1], population_size, axis=0),
+            np.repeat(self.counts[:1], population_size, axis=0),
+            np.repeat(self.colors[:1], population_size, axis=0),
+            np.repeat(self.fitness[:1], population_size, axis=0),
+        )
+
+    def copy(self):
+        return GenerationArrays(self.size, self.vertices.copy(), self.counts.copy(),
+                                self.colors.copy(), self.fitness.copy())
+
+    def order_by_fitness(self):
+        """
+        Orders the members by fitness score (descending), keeping ties in
+        member order like Generation.order_by_fitness().
+        """
+        order = np.argsort(-self.fitness, kind="stable")
+        self.vertices = self.vertices[order]
+        self.counts = self.counts[order]
+        self.colors = self.colors[order]
+        self.fitness = self.fitness[order]
+
+    def ensure_capacity(self, max_vertices):
+        """
+        Grows the vertex padding so every gene can hold max_vertices.
+        """
+        if max_vertices <= self.max_vertices:
+            return
+        padding = max(max_vertices, 2 * self.max_vertices) - self.max_vertices
+        self.vertices = np.pad(self.vertices, ((0, 0), (0, 0), (0, padding), (0, 0)))
+
+    def gene_vertices(self, p, g):
+        """
+        The vertices of one gene as a list of [x, y] pairs.
+        """
+        return self.vertices[p, g, :self.counts[p, g]].tolist()
+
+    def to_individual(self, p):
+        """
+        Unpacks one member into an Individual.
+        """
+        genome = []
+        for g in range(self.num_genes):
+            points = [tuple(v) for v in self.gene_vertices(p, g)]
+            genome.append(Gene(self.size, vertices=points, color=tuple(self.colors[p, g].tolist())))
+
+        individual = Individual(self.size, genome=genome, num_genes=self.num_genes)
+        individual.fitness = float(self.fitness[p])
+        return individual
+
+    def to_individuals(self):
+        return [self.to_individual(p) for p in range(self.population_size)]
+
+    def to_generation(self):
+        return Generation(self.size, individuals=self.to_individuals(), population_size=self.population_size)
+
+    def to_bytes(self):
+        """
+        Serializes the arrays (trimmed to the vertices in use) to bytes.
+        """
+        buffer = io.BytesIO()
+        used = int(self.counts.max(initial=0))
+        np.savez(buffer, size=np.array(self.size), vertices=self.vertices[:, :, :used],
+                 counts=self.counts, colors=self.colors, fitness=self.fitness)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds arrays written by to_bytes().
+        """
+        arrays = np.load(io.BytesIO(data))
+        return cls(tuple(arrays["size"].tolist()), arrays["vertices"], arrays["counts"],
+                   arrays["colors"], arrays["fitness"])
@@ -4,67 +4,457 @@ genetic_algorithm.py
 Genetic Algorithm implementation on images where semi-transparent colored polygons are the genes.
 
 NOTES:
-    - fitness function is MSE to start, but eventually will account for curved color space
+    - fitness function is MSE by default; perceptual metrics (Lab Delta E, SSIM, MS-SSIM) are in metrics.py
     - start with 0 genes, only add a gene if fitness slope is less than some value
     - OR initialize all genes to background color
 
 """
 
-import copy
+import time
 import numpy as np
-from random import randint
+from collections import deque
+from version_2 import batch_mutation, checkpoint, genome_format
+from version_2.color_solver import ColorSolver
 from version_2.image_renderer import ImageRenderer
 from version_2.individual import Individual
 from version_2.generation import Generation
+from version_2.generation_arrays import GenerationArrays
+from version_2.target import Target
+from version_2.evaluator import Evaluator, ProcessPoolEvaluator, SampledEvaluator
+from version_2.stats import DTYPE as STATS_DTYPE, StatsHistory
+from version_2.snapshot_writer import SnapshotWriter
+from version_2.pyramid import rescale
+
+RETENTION_POLICIES = ("all", "last", "elite", "none")
 
 class GeneticAlgorithm:
 
-    def __init__(self, target):
+    def __init__(self, target, render_backend="inplace", incremental=False, num_workers=1,
+                 retention="last", history_size=1, snapshot_writer=None, pyramid=None, sample=None,
+                 early_exit=False, checkpointer=None, run_log=None, seed=None, instrumentation=None,
+                 error_metric="ssd", error_weights=None, solve_colors=False, refine_every=None,
+                 array_mode=False):
         self.population_size = 50
         self.num_generations = 2000
+        self.time_budget = None # seconds evolve() may run before it stops early, None for no limit
         self.num_genes = 10 # 50?
         self.genome_mutation_rate = .25 # 25% likelihood for a gene to be selected
 
+        # every random draw of the run comes from this stream; seed is an int, a SeedSequence or None
+        self.rng = np.random.default_rng(seed)
+
         self.target = target # the png provided
         self.target_size = target.size
+        self.prepared_target = Target(target) # converted once, read by every fitness metric
+        self.renderer = ImageRenderer(backend=render_backend)
+
+        # re-render only the region mutation changed (see incremental_renderer.py). It pays off
+        # only when clones change a small part of the image: with one mutated gene per clone
+        # (genome_mutation_rate <= 1 / num_genes) a generation took 0.84x the time at 160x120
+        # and 0.55-0.65x from 320x240 to 1280x720. At the default rate the mutated genes of a
+        # clone span most of the image, so clones are rendered in full and it took 0.88-1.15x.
+        self.incremental = incremental
+        self.num_workers = num_workers # fitness evaluation processes, 1 evaluates in this process
+        self.early_exit = early_exit # stop scoring a candidate once it is certainly worse than the elite
+        self.error_metric = error_metric # a fitness metric of metrics.py, "ssd" (MSE) by default
+        self.error_weights = error_weights # per-channel weights of the "weighted" metric
+        self.evaluator = self.serial_evaluator()
+        self.kept_evaluator = None # evaluator of the last evolve(keep_evaluator=True), reused by the next
+
+        # score candidates on a FitnessSample and confirm only the promising ones in full, if given
+        if sample and (incremental or early_exit or num_workers > 1):
+            raise ValueError("Sampled fitness runs serially, without incremental rendering or early exit")
+        self.sample = sample
+        if sample and sample.seed is None:
+            sample.rng = self.rng.spawn(1)[0] # samples are drawn from a child of the run's stream
+
+        # closed-form polygon colors (see color_solver.py): genes whose shape mutates get the
+        # optimal color for the new shape, and every refine_every generations all of the
+        # elite's colors are solved at once; new genomes start from their solved colors
+        self.solve_colors = solve_colors
+        self.refine_every = refine_every
+        self.color_solver = ColorSolver(self.prepared_target) if solve_colors or refine_every else None
+
+        # whole generations as GenerationArrays (see generation_arrays.py), mutated by
+        # batch_mutation.py and scored from the arrays with full renders. This is not
+        # a speedup: batch mutation is about twice as fast from 50 genes up, but
+        # rendering dominates a generation, which measured 0.9-1.07x the time of the
+        # object path from 160x120 to 1280x720 with 10 to 150 genes. It keeps retained
+        # generations compact and is the place for batched operators.
+        if array_mode and (incremental or early_exit or sample or num_workers > 1 or solve_colors):
+            raise ValueError("Array mode runs serially with full renders, without incremental rendering, "
+                             "early exit, sampled fitness or solved colors")
+        self.array_mode = array_mode
+
+        # coarse-to-fine evolution over the levels of a Pyramid, if given
+        self.pyramid = pyramid
+        self.level = None # current pyramid level
+        self.level_start = 0 # generations that ran before the current level
+
+        # which Generations are kept after they are evaluated:
+        #   "all"   - every generation (memory grows with the run)
+        #   "last"  - the last history_size generations
+        #             (GenerationArrays in array mode)
+        #   "elite" - only the latest elite, as a one-individual Generation
+        #   "none"  - nothing but the current elite
+        if retention not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {retention}")
+        self.retention = retention
+        self.history_size = history_size
+
+        # images of the elite, written on a background thread (every generation by default)
+        self.snapshot_writer = snapshot_writer if snapshot_writer else SnapshotWriter()
+
+        # periodic checkpoints of the run, written on a background thread, if given
+        self.checkpointer = checkpointer
+        self.resume_state = None # checkpoint to continue from, set by resume()
+
+        # a RunLog record per elite improvement, if given
+        self.run_log = run_log
+
+        # per-phase timing of each generation, if given (see instrumentation.py)
+        self.instrumentation = instrumentation
 
         self.elite_individual = None # random initialization later
-        self.generations = [] # all generations containing all individuals
+        # retained generations; only "all" grows with the run
+        if retention == "last":
+            self.generations = deque(maxlen=history_size)
+        elif retention == "elite":
+            self.generations = deque(maxlen=1)
+        else:
+            self.generations = []
+        self.stats = StatsHistory() # a row of statistics per generation
+        self.generations_done = 0
+
+
+    def evolve(self, keep_evaluator=False):
+        """
+        Runs the genetic algorithm up to num_generations, or until the
+        time budget runs out. Continues the run after resume(), or when
+        called again with a larger num_generations.
 
+        Args:
+            keep_evaluator (bool): Keep the evaluator (a worker pool, or the
+                sample and counters of sampled fitness) for the next call
+                instead of building a new one; close_evaluator() releases it.
+
+        The snapshot writer and checkpointer are flushed when the run stops,
+        but nothing passed in (run_log, instrumentation, writers) is closed:
+        evolve() may be called again, and the caller closes them when done.
+        """
+        run_start = time.perf_counter()
+        inst = self.instrumentation
+
+        if self.pyramid and self.level is None:
+            self.set_level(0)
+
+        # a persistent worker pool for the whole run (or pyramid level), if requested
+        evaluator = self.kept_evaluator if self.kept_evaluator is not None else self.make_evaluator()
+        self.kept_evaluator = None
+
+        try:
+            if self.resume_state is not None:
+                self.rng.bit_generator.state = self.resume_state["random_state"]
+                if self.sample:
+                    evaluator.restore(self.resume_state["sample_state"])
+                self.resume_state = None
+            elif self.elite_individual is None:
+                # random initialization
+                self.elite_individual = Individual(self.target_size, num_genes=self.num_genes, rng=self.rng)
+                if self.color_solver:
+                    self.elite_individual = self.color_solver.refine(self.elite_individual)
+            evaluator.set_elite(self.elite_individual)
+
+            for gen in range(self.generations_done, self.num_generations):
+                if self.time_budget is not None and time.perf_counter() - run_start > self.time_budget:
+                    break
+                print(f"Generation {gen+1}")
+                start_time = time.perf_counter()
+                if inst:
+                    inst.start_generation(gen + 1)
+
+                # move to a finer pyramid level when the schedule says so or progress stalls
+                if self.pyramid and self.pyramid.advance(self.level, self.stats, self.level_start,
+                                                         self.evaluator.max_error):
+                    evaluator = self.advance_level(evaluator)
+                if inst:
+                    inst.mark("level")
+
+                # solve every color of the elite at once, kept only if it scores better
+                refined = False
+                if self.refine_every and (gen + 1) % self.refine_every == 0:
+                    refined = self.refine_elite(evaluator, gen + 1)
+                if inst:
+                    inst.mark("refine")
+
+                # generate replacement candidates
+                generation = self.reproduce_arrays() if self.array_mode else self.reproduce()
 
-    def evolve(self):
+                # evaluate candidates
+                phase_times = None
+                if inst and isinstance(evaluator, Evaluator):
+                    phase_times = evaluator.phase_times = [0.0, 0.0]
+                if self.array_mode:
+                    scores = evaluator.evaluate_arrays(generation)
+                    generation.fitness[:] = scores
+                else:
+                    scores = evaluator.evaluate(generation.population)
+                    for ind, score in zip(generation, scores):
+                        ind.set_fitness(score)
+                if inst:
+                    inst.mark("evaluate")
+                    if phase_times:
+                        inst.add("render", phase_times[0])
+                        inst.add("error", phase_times[1])
+                        evaluator.phase_times = None
+
+                # sort by fitness
+                generation.order_by_fitness()
+                if inst:
+                    inst.mark("sort")
+
+                # replace if necessary
+                if self.array_mode:
+                    # only a winner is unpacked into an Individual
+                    improved = generation.fitness[0] > self.elite_individual.fitness
+                    most_fit = generation.to_individual(0) if improved else None
+                elif self.sample:
+                    # the sample only shortlists; the elite is replaced on a full-resolution win
+                    confirmed = evaluator.confirm(generation.population)
+                    improved = confirmed is not None
+                    most_fit = confirmed if improved else generation.population[0]
+                else:
+                    most_fit = generation.population[0] # most fit of the generation
+                    improved = most_fit.fitness > self.elite_individual.fitness
+                if improved:
+                    if inst:
+                        inst.improvement(self.elite_individual.fitness, most_fit.fitness)
+                    self.elite_individual = most_fit
+                    evaluator.set_elite(self.elite_individual)
+                    if self.run_log:
+                        self.run_log.append(gen + 1, self.elite_individual)
+                if inst:
+                    inst.mark("select")
+
+                # save image of most fit Individual, reusing the evaluator's render when it has one
+                if self.snapshot_writer.wants(gen + 1, improved or refined):
+                    pixels = evaluator.rendered(self.elite_individual)
+                    if pixels is None:
+                        pixels = self.renderer.render_array(self.elite_individual)
+                    self.snapshot_writer.submit(gen + 1, pixels)
+                if inst:
+                    inst.mark("snapshot")
+
+                band_counts = evaluator.band_counts if self.early_exit else None
+                self.stats.append(gen + 1, scores, self.elite_individual, time.perf_counter() - start_time,
+                                  self.target_size, band_counts, sampled=bool(self.sample))
+                self.retain(generation, self.elite_individual if improved else None)
+                self.generations_done = gen + 1
+
+                if self.checkpointer and self.checkpointer.wants(gen + 1):
+                    self.checkpointer.submit(self.checkpoint_state(evaluator))
+                if inst:
+                    inst.mark("record")
+                    inst.end_generation(len(scores), improved, self.elite_individual.fitness)
+        finally:
+            if keep_evaluator:
+                self.kept_evaluator = evaluator
+            elif evaluator is not self.evaluator:
+                evaluator.close()
+            try: # wait for queued writes; either writer may raise the error of a failed write
+                self.snapshot_writer.flush()
+            finally:
+                if self.checkpointer:
+                    self.checkpointer.flush()
+
+    def close_evaluator(self):
         """
-        Runs the genetic algorithm.
+        Closes the evaluator kept by evolve(keep_evaluator=True), if any.
         """
+        if self.kept_evaluator is not None and self.kept_evaluator is not self.evaluator:
+            self.kept_evaluator.close()
+        self.kept_evaluator = None
 
-        # random initialization
-        self.elite_individual = Individual(self.target_size, num_genes=self.num_genes)
+    def checkpoint_state(self, evaluator):
+        """
+        Captures everything needed to continue the run from here. Called
+        between generations; the copies are small so the loop is not held up.
 
-        for gen in range(self.num_generations):
-            print(f"Generation {gen+1}")
-            # generate replacement candidates
-            self.generations.append(self.reproduce())
+        Returns:
+            (dict): The run state, for a Checkpointer.
+        """
+        return {
+            "generation": self.generations_done,
+            "genome": genome_format.encode(self.elite_individual),
+            "elite_fitness": float(self.elite_individual.fitness),
+            "random_state": self.rng.bit_generator.state,
+            "hyperparameters": {
+                "target_size": self.target.size,
+                "population_size": self.population_size,
+                "num_generations": self.num_generations,
+                "num_genes": self.num_genes,
+                "genome_mutation_rate": self.genome_mutation_rate,
+                "render_backend": self.renderer.backend,
+                "incremental": self.incremental,
+                "early_exit": self.early_exit,
+                "error_metric": self.error_metric,
+                "error_weights": self.error_weights,
+                "solve_colors": self.solve_colors,
+                "refine_every": self.refine_every,
+                "retention": self.retention,
+                "history_size": self.history_size,
+                "array_mode": self.array_mode,
+            },
+            "stats": np.array(self.stats.array, dtype=STATS_DTYPE), # a plain structured array, not a recarray
+            "level": self.level,
+            "level_start": self.level_start,
+            "sample_state": evaluator.state() if self.sample else None,
+        }
+
+    @classmethod
+    def resume(cls, path, target, **options):
+        """
+        Rebuilds a run from a checkpoint. evolve() then continues it exactly
+        as the original run would have continued.
 
-            #for ind in self.generations[gen].individuals:
-            for ind in self.generations[gen]:
-                # evaluate candidates
-                #score = self.evaluate_fitness_mse(self.generations[gen].individuals[ind])
-                score = self.evaluate_fitness_mse(ind)
-                #self.generations[gen].individuals[ind].set_fitness(score)
-                ind.set_fitness(score)
+        Args:
+            path (str): The checkpoint file.
+            target (Image): The same target image as the original run.
+            options: Constructor arguments the checkpoint does not hold
+                (num_workers, snapshot_writer, checkpointer, run_log, and the same
+                pyramid or sample as the original run, if it used them).
 
-            # sort by fitness
-            self.generations[gen].order_by_fitness()
+        Returns:
+            (GeneticAlgorithm): The restored run.
+        """
+        state = checkpoint.load(path)
+        params = state["hyperparameters"]
+        if tuple(target.size) != tuple(params["target_size"]):
+            raise ValueError("The target does not match the checkpoint")
+
+        gen_alg = cls(target, render_backend=params["render_backend"], incremental=params["incremental"],
+                      retention=params["retention"], history_size=params["history_size"],
+                      early_exit=params["early_exit"], error_metric=params.get("error_metric", "ssd"),
+                      error_weights=params.get("error_weights"), solve_colors=params.get("solve_colors", False),
+                      refine_every=params.get("refine_every"), array_mode=params.get("array_mode", False),
+                      **options)
+        gen_alg.population_size = params["population_size"]
+        gen_alg.num_generations = params["num_generations"]
+        gen_alg.num_genes = params["num_genes"]
+        gen_alg.genome_mutation_rate = params["genome_mutation_rate"]
+
+        gen_alg.stats = StatsHistory.from_array(state["stats"])
+        gen_alg.generations_done = state["generation"]
+        if gen_alg.run_log:
+            gen_alg.run_log.truncate_after(gen_alg.generations_done) # the original run may have logged past the checkpoint
+        if gen_alg.pyramid:
+            gen_alg.set_level(state["level"])
+            gen_alg.level_start = state["level_start"]
+
+        gen_alg.elite_individual = genome_format.decode(state["genome"], gen_alg.target_size)
+        gen_alg.elite_individual.set_fitness(state["elite_fitness"])
+        gen_alg.resume_state = state
+        return gen_alg
+
+    def make_evaluator(self):
+        """
+        The evaluator for the current target: a sampled evaluator if a
+        sample is set, a new worker pool if num_workers > 1, otherwise the
+        serial evaluator.
+        """
+        if self.sample:
+            return SampledEvaluator(self.prepared_target, self.renderer.backend, self.sample,
+                                    self.error_metric, self.error_weights)
+        if self.num_workers > 1:
+            return ProcessPoolEvaluator(self.prepared_target, self.renderer.backend,
+                                        self.incremental, self.num_workers, self.early_exit,
+                                        metric=self.error_metric, weights=self.error_weights)
+        return self.evaluator
+
+    def serial_evaluator(self):
+        """
+        An Evaluator for the current target with the run's settings.
+        """
+        return Evaluator(self.prepared_target, self.renderer.backend, self.incremental, self.early_exit,
+                         metric=self.error_metric, weights=self.error_weights)
 
-            # replace if necessary
-            most_fit = self.generations[gen].population[0] # most fit of the generation
-            if most_fit.fitness > self.elite_individual.fitness:
-                self.elite_individual = most_fit
+    def set_level(self, level):
+        """
+        Evaluates against a pyramid level from now on.
+        """
+        self.level = level
+        self.level_start = len(self.stats)
+        self.prepared_target = self.pyramid.targets[level]
+        self.target_size = self.prepared_target.size
+        self.evaluator = self.serial_evaluator()
+        if self.color_solver:
+            self.color_solver = ColorSolver(self.prepared_target)
+
+    def advance_level(self, evaluator):
+        """
+        Moves to the next finer pyramid level: rescales the elite, scores it
+        against the new level and replaces the evaluator.
 
-            # save image of most fit Individual
-            ir = ImageRenderer()
-            file_name = f"gen{len(self.generations)}"
-            ir.save_image(ir.create_image(self.elite_individual), f"./polyevolve_images/{file_name}.png")
+        Args:
+            evaluator: The evaluator of the current level.
+
+        Returns:
+            The evaluator of the new level.
+        """
+        if evaluator is not self.evaluator:
+            evaluator.close()
+
+        self.set_level(self.level + 1)
+        self.elite_individual = rescale(self.elite_individual, self.target_size)
+        self.elite_individual.set_fitness(self.evaluator.fitness_mse(self.elite_individual))
+
+        evaluator = self.make_evaluator()
+        evaluator.set_elite(self.elite_individual)
+        return evaluator
+
+    def refine_elite(self, evaluator, generation):
+        """
+        Solves the color of every gene of the elite (see ColorSolver.refine())
+        and makes the result the elite if it scores better.
+
+        Args:
+            evaluator: The evaluator of the run, told about a new elite.
+            generation (int): The generation number, for the run log.
+
+        Returns:
+            (bool): Whether the elite improved.
+        """
+        refined = self.color_solver.refine(self.elite_individual)
+        refined.set_fitness(self.evaluator.fitness_mse(refined))
+        if refined.fitness <= self.elite_individual.fitness:
+            return False
+
+        if self.instrumentation:
+            self.instrumentation.improvement(self.elite_individual.fitness, refined.fitness)
+        self.elite_individual = refined
+        evaluator.set_elite(self.elite_individual)
+        if self.run_log:
+            self.run_log.append(generation, self.elite_individual)
+        self.retain(elite=self.elite_individual)
+        return True
+
+    def retain(self, generation=None, elite=None):
+        """
+        Keeps an evaluated generation, or a new elite, according to the
+        retention policy.
+
+        Args:
+            generation (Generation): The evaluated, sorted generation (a
+                GenerationArrays in array mode), None
+                when only the elite changed (e.g. by refine_elite()).
+            elite (Individual): The new elite, if it was replaced. With
+                sampled fitness it need not be the generation's first
+                individual.
+        """
+        if self.retention in ("all", "last") and generation is not None:
+            self.generations.append(generation)
+        elif self.retention == "elite" and elite is not None:
+            self.generations.append(Generation(self.target_size, individuals=[elite], population_size=1))
 
     def evaluate_fitness_mse(self, individual):
         """
@@ -80,28 +470,13 @@ class GeneticAlgorithm:
             (int): The fitness score (higher is better).
 
         """
-        target_rgb = self.target.convert('RGBA')
-
-        renderer = ImageRenderer()
-        individual_image = renderer.create_image(individual)
-        individual_rgb = renderer.convert_image(individual_image)
-
-        target_arr = np.array(target_rgb).astype(np.int32)
-        individual_arr = np.array(individual_rgb).astype(np.int32)
-
-        squared_error = (target_arr[:,:,:3] - individual_arr[:,:,:3]) ** 2
-        mse = np.mean(np.sum(squared_error, axis=2))
-        assert mse >= 0, "MSE must be non-negative"
-
-        max_possible_mse = 195075
-        fitness_score = max_possible_mse - mse
-        #print(f"{fitness_score}\n")                                                                        #FIXME
-        return fitness_score
+        return self.evaluator.fitness_mse(individual)
 
     def reproduce(self):
         """
         Creates a new generation of Individuals using asexual reproduction and mutation.
-        A clone of the elite Individual is created, then mutated.
+        A clone of the elite Individual is created, then mutated. Clones share
+        Genes with the elite; only the Genes that mutate are copied.
 
         Returns:
             (Generation): The new generation of Individuals.
@@ -110,32 +485,37 @@ class GeneticAlgorithm:
 
         # clone elite
         for _ in range(self.population_size):
-            new_individual = copy.deepcopy(self.elite_individual)
+            new_individual = self.elite_individual.clone()
             new_individuals.append(new_individual)
 
         new_generation = Generation(self.target_size, individuals=new_individuals, population_size=self.population_size)
+        if self.instrumentation:
+            self.instrumentation.mark("clone")
 
         # mutate clones
         for individual in new_generation:
-            individual.mutate(self.genome_mutation_rate)
+            individual.mutate(self.genome_mutation_rate, self.rng, self.color_solver if self.solve_colors else None)
+        if self.instrumentation:
+            self.instrumentation.mark("mutate")
 
         #self.generations.append(new_generation)
         return new_generation
 
-    def mutate(self, generation):
+    def reproduce_arrays(self):
         """
-        Mutates select individuals from a generation.
-
-        Args:
-            generation: A population of individuals.
+        reproduce() for array mode: the elite is packed once and repeated
+        into a GenerationArrays, then every clone is mutated in one pass
+        by batch_mutation.mutate().
 
+        Returns:
+            (GenerationArrays): The new generation.
         """
-        num_mutate = int(self.population_mutation_rate * self.population_size)
-        mutate_indices = set()
+        new_generation = GenerationArrays.clones(self.elite_individual, self.population_size)
+        if self.instrumentation:
+            self.instrumentation.mark("clone")
 
-        while len(mutate_indices) < num_mutate:
-            selected_index = randint(0, self.population_size - 1)
-            mutate_indices.add(selected_index)
+        batch_mutation.mutate(new_generation, self.rng, self.genome_mutation_rate)
+        if self.instrumentation:
+            self.instrumentation.mark("mutate")
 
-        for index in mutate_indices:
-            generation.individuals[index].mutate_gene()
\ No newline at end of file
+        return new_generation
@@ -0,0 +1,107 @@
+"""
+genome_format.py
+
+Compact, versioned binary form of an Individual's genome. Used to send
+genomes to worker processes, in checkpoints and in run logs (run_log.py).
+
+Layout (version 1, little endian):
+    uint8                   format version
+    varint                  number of genes
+    varint[genes]           vertex count of each gene
+    uint16[vertices, 2]     x, y of every vertex, gene after gene
+    uint8[genes, 4]         RGBA color of each gene
+
+Varints are unsigned LEB128: 7 bits per byte, low bits first, the high bit
+set on every byte but the last. Vertex counts below 128 take one byte.
+
+The canvas size is not stored; the reader supplies it.
+"""
+
+import numpy as np
+from version_2.gene import Gene
+from version_2.individual import Individual
+
+VERSION = 1
+
+def encode_varint(value):
+    """
+    Encodes a non-negative integer as an unsigned LEB128 varint.
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(data, offset):
+    """
+    Reads an unsigned LEB128 varint.
+
+    Returns:
+        (tuple): (value, offset just past the varint).
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def encode(individual):
+    """
+    Packs an Individual's genome into bytes.
+
+    Args:
+        individual (Individual): The individual to be packed.
+
+    Returns:
+        (bytes): The packed genome.
+    """
+    genome = individual.genome
+    counts = [len(gene.vertices) for gene in genome]
+    vertices = np.array([v for gene in genome for v in gene.vertices], dtype="<u2")
+    colors = np.array([gene.color for gene in genome], dtype=np.uint8)
+
+    if max(counts, default=0) < 0x80 and len(genome) < 0x80:
+        header = bytes([VERSION, len(genome)] + counts) # every varint is a single byte
+    else:
+        header = bytes([VERSION]) + encode_varint(len(genome)) + b"".join(encode_varint(c) for c in counts)
+    return header + vertices.tobytes() + colors.tobytes()
+
+def decode(data, size):
+    """
+    Rebuilds an Individual from bytes written by encode().
+
+    Args:
+        data (bytes): The packed genome (or any buffer holding it).
+        size (tuple): (width, height) of the canvas.
+
+    Returns:
+        (Individual): The rebuilt individual.
+    """
+    if data[0] != VERSION:
+        raise ValueError(f"Unsupported genome format version: {data[0]}")
+
+    num_genes, offset = decode_varint(data, 1)
+    counts = []
+    for _ in range(num_genes):
+        count, offset = decode_varint(data, offset)
+        counts.append(count)
+
+    total = sum(counts)
+    vertices = np.frombuffer(data, dtype="<u2", count=2 * total, offset=offset).reshape(-1, 2)
+    offset += 4 * total
+    colors = np.frombuffer(data, dtype=np.uint8, count=4 * num_genes, offset=offset).reshape(-1, 4)
+
+    genome = []
+    start = 0
+    for count, color in zip(counts, colors.tolist()):
+        points = [tuple(v) for v in vertices[start:start + count].tolist()]
+        genome.append(Gene(size, vertices=points, color=tuple(color)))
+        start += count
+
+    return Individual(size, genome=genome, num_genes=num_genes)
@@ -0,0 +1,267 @@
+"""
+geometry.py
+
+Polygon tests used by mutation, in NumPy instead of Shapely. Every function
+takes a batch of polygons as padded arrays, the layout of GenerationArrays:
+
+    points      int[n, max_vertices, 2]   padded (the padding is ignored)
+    counts      int[n]                    vertices in use
+
+and gives the same answers as Shapely for the integer polygons this
+project uses:
+    - valid_shapes():    Polygon(vertices).is_simple and .is_valid
+    - centroids():       Polygon(vertices).centroid
+    - order_clockwise(): Gene.order_cw
+
+valid_shape() and order_cw() do the same for a single vertex list.
+
+NOTES:
+    - vertex coordinates are integers, so the orientation tests are exact
+    - repeated consecutive vertices are ignored, as Shapely does
+    - the simplicity test compares every pair of edges, which is cheap for
+      the small vertex counts of genes but grows with the square of the count
+"""
+
+import math
+import numpy as np
+
+ATAN2 = np.frompyfunc(math.atan2, 2, 1)
+
+def pad(polygons):
+    """
+    Packs a list of vertex lists into padded arrays.
+
+    Returns:
+        (tuple): (points, counts).
+    """
+    counts = np.array([len(polygon) for polygon in polygons], dtype=np.intp)
+    points = np.zeros((len(polygons), counts.max(initial=1), 2), dtype=np.int64)
+    for i, polygon in enumerate(polygons):
+        points[i, :len(polygon)] = polygon
+    return points, counts
+
+def following(counts, max_vertices):
+    """
+    (n, max_vertices) index of the vertex after each one, wrapping at each
+    polygon's own count.
+    """
+    after = np.arange(1, max_vertices + 1)
+    return np.where(after < counts[:, None], after, 0)
+
+def in_use(counts, max_vertices):
+    """
+    (n, max_vertices) mask of the vertices in use.
+    """
+    return np.arange(max_vertices) < counts[:, None]
+
+def remove_repeated(points, counts):
+    """
+    Drops vertices equal to the vertex after them (including the last
+    vertex when it closes the ring), moving the padding to the end.
+
+    Returns:
+        (tuple): (points, counts).
+    """
+    max_vertices = points.shape[1]
+    after = np.take_along_axis(points, following(counts, max_vertices)[..., None], axis=1)
+    keep = in_use(counts, max_vertices) & np.any(points != after, axis=2)
+
+    order = np.argsort(~keep, axis=1, kind="stable")
+    return np.take_along_axis(points, order[..., None], axis=1), keep.sum(axis=1)
+
+def cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+def signed_areas(points, counts):
+    """
+    Twice the signed area of each polygon (shoelace formula), positive when
+    counter-clockwise in the usual y-up orientation.
+    """
+    points = points.astype(np.int64)
+    after = np.take_along_axis(points, following(counts, points.shape[1])[..., None], axis=1)
+    terms = cross(points[..., 0], points[..., 1], after[..., 0], after[..., 1])
+    return np.where(in_use(counts, points.shape[1]), terms, 0).sum(axis=1)
+
+def centroids(points, counts):
+    """
+    Area centroids, accumulated over a fan of triangles from the first
+    vertex like GEOS so the results agree to the last bit.
+
+    Returns:
+        (tuple): (cx, cy) float arrays of shape (n,).
+    """
+    x = points[..., 0].astype(np.float64)
+    y = points[..., 1].astype(np.float64)
+    bx, by = x[:, :1], y[:, :1]
+
+    # triangle (base, i, i + 1) for i in 1 .. count - 2
+    x1, y1 = x[:, 1:-1], y[:, 1:-1]
+    x2, y2 = x[:, 2:], y[:, 2:]
+    area2 = cross(x1 - bx, y1 - by, x2 - bx, y2 - by)
+    area2 = np.where(np.arange(2, points.shape[1]) < counts[:, None], area2, 0)
+
+    total = area2.sum(axis=1)
+    cx = (area2 * (bx + x1 + x2)).sum(axis=1) / 3 / total
+    cy = (area2 * (by + y1 + y2)).sum(axis=1) / 3 / total
+    return cx, cy
+
+def order_clockwise(points, counts):
+    """
+    Sorts the vertices of each polygon by descending angle about its
+    centroid (Gene.order_cw), leaving the padding at the end.
+
+    Returns:
+        (ndarray): The reordered points.
+    """
+    if len(points) == 0:
+        return points
+
+    # math.atan2 rather than np.arctan2, whose SIMD versions can differ in the last
+    # bit and break ties between vertices on the same ray from the centroid
+    cx, cy = centroids(points, counts)
+    angles = ATAN2(points[..., 1] - cy[:, None], points[..., 0] - cx[:, None]).astype(np.float64)
+
+    # stable, so ties keep their order as with sorted(..., reverse=True)
+    keys = np.where(in_use(counts, points.shape[1]), -angles, np.inf)
+    order = np.argsort(keys, axis=1, kind="stable")
+    return np.take_along_axis(points, order[..., None], axis=1)
+
+def zero_areas(points, counts):
+    """
+    Whether each polygon encloses no area.
+    """
+    return signed_areas(points, counts) == 0
+
+def simple(points, counts):
+    """
+    Whether each polygon's boundary never meets itself: edges that are not
+    neighbours must not touch, and neighbours must not fold back over each
+    other. Expects repeated vertices to be removed already.
+    """
+    points = points.astype(np.int64)
+    max_vertices = points.shape[1]
+    indices = np.arange(max_vertices)
+    used = in_use(counts, max_vertices)
+
+    start = points
+    end = np.take_along_axis(points, following(counts, max_vertices)[..., None], axis=1)
+    dx, dy = end[..., 0] - start[..., 0], end[..., 1] - start[..., 1]
+
+    # neighbouring edges fold back when they are parallel and point in opposite directions
+    next_dx = np.take_along_axis(dx, following(counts, max_vertices), axis=1)
+    next_dy = np.take_along_axis(dy, following(counts, max_vertices), axis=1)
+    folds = (cross(dx, dy, next_dx, next_dy) == 0) & (dx * next_dx + dy * next_dy < 0)
+    folded = np.any(used & folds, axis=1)
+
+    # every pair of edges i < j that do not share a vertex
+    i, j = indices[:, None], indices[None, :]
+    last = (counts - 1)[:, None, None]
+    pairs = (i < j) & (j != i + 1) & used[:, :, None] & used[:, None, :]
+    pairs &= ~((i == 0) & (j == last))
+
+    ax, ay = start[..., 0][:, :, None], start[..., 1][:, :, None]
+    bx, by = end[..., 0][:, :, None], end[..., 1][:, :, None]
+    cx, cy = start[..., 0][:, None, :], start[..., 1][:, None, :]
+    ex, ey = end[..., 0][:, None, :], end[..., 1][:, None, :]
+
+    o1 = np.sign(cross(bx - ax, by - ay, cx - ax, cy - ay))
+    o2 = np.sign(cross(bx - ax, by - ay, ex - ax, ey - ay))
+    o3 = np.sign(cross(ex - cx, ey - cy, ax - cx, ay - cy))
+    o4 = np.sign(cross(ex - cx, ey - cy, bx - cx, by - cy))
+
+    # closed segments meet if each straddles the other's line; collinear
+    # segments additionally need overlapping extents
+    meet = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+    collinear = (o1 == 0) & (o2 == 0)
+    overlap = ((np.maximum(ax, bx) >= np.minimum(cx, ex)) & (np.maximum(cx, ex) >= np.minimum(ax, bx)) &
+               (np.maximum(ay, by) >= np.minimum(cy, ey)) & (np.maximum(cy, ey) >= np.minimum(ay, by)))
+    meet &= ~collinear | overlap
+
+    return ~folded & ~np.any(pairs & meet, axis=(1, 2))
+
+def valid_shapes(points, counts):
+    """
+    Whether each polygon is valid and simple (Gene.valid_shape): at least
+    three distinct vertices, non-zero area and no self-intersections.
+
+    Returns:
+        (ndarray): (n,) booleans.
+    """
+    if len(points) == 0:
+        return np.zeros(0, dtype=bool)
+
+    points, counts = remove_repeated(points, counts)
+    return (counts >= 3) & ~zero_areas(points, counts) & simple(points, counts)
+
+# Single polygons: the same tests in plain Python, which beats NumPy's
+# per-call overhead at the handful of vertices a Gene has.
+
+def valid_shape(vertices):
+    """
+    valid_shapes() for one polygon given as a list of (x, y) vertices.
+    """
+    points = [p for i, p in enumerate(vertices) if tuple(p) != tuple(vertices[(i + 1) % len(vertices)])]
+    n = len(points)
+    if n < 3 or polygon_area2(points) == 0:
+        return False
+
+    edges = [(points[i], points[(i + 1) % n]) for i in range(n)]
+    for i in range(n):
+        (ax, ay), (bx, by) = edges[i]
+        (cx, cy), (ex, ey) = edges[(i + 1) % n]
+        dx, dy, next_dx, next_dy = bx - ax, by - ay, ex - cx, ey - cy
+        if cross(dx, dy, next_dx, next_dy) == 0 and dx * next_dx + dy * next_dy < 0:
+            return False
+
+        for j in range(i + 2, n - 1 if i == 0 else n):
+            if segments_meet(edges[i], edges[j]):
+                return False
+    return True
+
+def segments_meet(first, second):
+    """
+    Whether two closed segments share at least one point.
+    """
+    (ax, ay), (bx, by) = first
+    (cx, cy), (ex, ey) = second
+    o1 = sign(cross(bx - ax, by - ay, cx - ax, cy - ay))
+    o2 = sign(cross(bx - ax, by - ay, ex - ax, ey - ay))
+    o3 = sign(cross(ex - cx, ey - cy, ax - cx, ay - cy))
+    o4 = sign(cross(ex - cx, ey - cy, bx - cx, by - cy))
+
+    if o1 * o2 > 0 or o3 * o4 > 0:
+        return False
+    if o1 == 0 and o2 == 0:
+        return (max(ax, bx) >= min(cx, ex) and max(cx, ex) >= min(ax, bx) and
+                max(ay, by) >= min(cy, ey) and max(cy, ey) >= min(ay, by))
+    return True
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+def polygon_area2(points):
+    """
+    Twice the signed area of one polygon.
+    """
+    n = len(points)
+    return sum(cross(*points[i], *points[(i + 1) % n]) for i in range(n))
+
+def centroid(points):
+    """
+    centroids() for one polygon.
+    """
+    bx, by = points[0]
+    total = sx = sy = 0
+    for (x1, y1), (x2, y2) in zip(points[1:-1], points[2:]):
+        area2 = float(cross(x1 - bx, y1 - by, x2 - bx, y2 - by))
+        total += area2
+        sx += area2 * (bx + x1 + x2)
+        sy += area2 * (by + y1 + y2)
+    return sx / 3 / total, sy / 3 / total
+
+def order_cw(points):
+    """
+    order_clockwise() for one polygon; returns a new sorted list.
+    """
+    cx, cy = centroid(points)
+    return sorted(points, key=lambda p: math.atan2(p[1] - cy, p[0] - cx), reverse=True)
@@ -3,12 +3,35 @@ image_renderer.py
 
 Used by genetic_algorithm.py to create candidate images.
 Also responsible for image I/O and display.
+
+Two rendering backends are available:
+    - "pillow": one full-size layer per gene, alpha composited with Pillow
+    - "inplace": every gene is drawn with Pillow's ImageDraw straight onto a
+      single RGB image, blending RGBA ink in place and touching only the
+      pixels it covers (see rasterizer.py); pixel-identical to "pillow"
 """
 
+import numpy as np
 from PIL import Image
 from PIL import ImageDraw
+from version_2 import rasterizer
+
+# "inplace" was first named "numpy", when it scan-converted polygons in NumPy;
+# the old name (e.g. in checkpoints) still selects it
+BACKENDS = ("pillow", "inplace")
+BACKEND_ALIASES = {"numpy": "inplace"}
 
 class ImageRenderer:
+    def __init__(self, backend="pillow"):
+        """
+        Args:
+            backend (str): The rendering backend, "pillow" or "inplace".
+        """
+        backend = BACKEND_ALIASES.get(backend, backend)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown rendering backend: {backend}")
+        self.backend = backend
+
     def load_image(self, path):
         """Load an image from the given path using Pillow."""
         return Image.open(path)
@@ -30,6 +53,36 @@ class ImageRenderer:
         return image.show()
 
     def create_image(self, individual):
+        """
+        Create an image from the given individual with the selected backend.
+
+        Parameters:
+            individual (Individual): The individual to be rendered.
+
+        Returns:
+            (Image): The rendered Pillow Image.
+        """
+        if self.backend == "inplace":
+            return Image.fromarray(self.render_array(individual), "RGB").convert("RGBA")
+
+        return self.create_image_pillow(individual)
+
+    def render_array(self, individual):
+        """
+        Render the given individual to an array with the selected backend.
+
+        Parameters:
+            individual (Individual): The individual to be rendered.
+
+        Returns:
+            (ndarray): A (height, width, 3) uint8 RGB array.
+        """
+        if self.backend == "inplace":
+            return rasterizer.render_rgb(individual.size, individual.genome)
+
+        return np.asarray(self.create_image_pillow(individual))[:, :, :3]
+
+    def create_image_pillow(self, individual):
         """
         Create an image from the given individual using Pillow.
 
@@ -0,0 +1,108 @@
+"""
+incremental_renderer.py
+
+Used by genetic_algorithm.py to score clones of the elite without rendering
+them from scratch.
+
+The elite's render and a summed-area table of its per-pixel squared error
+are kept. A clone only differs from the elite inside its dirty box (the
+union of the old and new bounding boxes of its mutated genes), so only that
+region is re-rendered, using only the genes that overlap it, and the
+elite's total error is updated by the difference. The elite's error over
+the box is read from the table in constant time.
+
+A dirty box covering most of the image saves nothing over a full render,
+so clones whose box covers more than max_fraction of it are rendered and
+scored in full instead.
+
+NOTES:
+    - renders with rasterizer.py, so scores match full renders exactly
+    - random genes span much of the image, so the dirty box of a clone with
+      several mutated genes is usually rendered in full; the saving comes
+      with one mutated gene per clone (see GeneticAlgorithm)
+"""
+
+import numpy as np
+from version_2 import rasterizer
+from version_2.error_kernels import ErrorKernel
+
+class IncrementalRenderer:
+    """
+    Holds the rendered elite and scores its clones by their dirty region.
+    """
+
+    def __init__(self, target, background=(0, 0, 0), max_fraction=.75):
+        """
+        Args:
+            target (Target): The prepared target image.
+            background (tuple): RGB background color.
+            max_fraction (float): Largest share of the image a dirty box may
+                cover and still be rendered on its own.
+        """
+        self.target = target
+        self.background = background
+        self.width, self.height = target.size
+        self.max_area = max_fraction * self.width * self.height
+        self.kernel = ErrorKernel(target.size)
+
+        self.pixels = None # elite's (height, width, 3) render
+        self.error_table = None # summed-area table of the elite's per-pixel squared error
+        self.total_error = None # elite's summed squared error
+        self.pixels_rendered = 0 # running count, for comparing against full renders
+        self.num_full = 0 # clones scored with a full render
+
+    def set_elite(self, individual):
+        """
+        Fully renders a new elite and caches its render and error table.
+        """
+        self.pixels = rasterizer.render_rgb(self.target.size, individual.genome, self.background)
+        diff = self.pixels.astype(np.int32) - self.target.pixels
+        pixel_error = (diff * diff).sum(axis=2)
+
+        self.error_table = np.zeros((self.height + 1, self.width + 1), dtype=np.int64)
+        np.cumsum(np.cumsum(pixel_error, axis=0), axis=1, out=self.error_table[1:, 1:])
+        self.total_error = int(self.error_table[-1, -1])
+        self.pixels_rendered += self.width * self.height
+
+    def squared_error(self, individual):
+        """
+        Summed squared error of a mutated clone of the cached elite.
+
+        Args:
+            individual (Individual): A clone of the elite, after mutate().
+
+        Returns:
+            (int): The squared error summed over all pixels and channels.
+        """
+        box = self.clip(individual.dirty_box)
+        if box is None:
+            return self.total_error # nothing visible changed
+
+        x0, y0, x1, y1 = box
+        area = (x1 - x0) * (y1 - y0)
+        if area > self.max_area:
+            self.num_full += 1
+            self.pixels_rendered += self.width * self.height
+            pixels = rasterizer.render_rgb(self.target.size, individual.genome, self.background)
+            return self.kernel.error(pixels, self.target.pixels)
+
+        patch = rasterizer.render_region(box, individual.genome, self.background)
+        self.pixels_rendered += area
+
+        table = self.error_table
+        old_error = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        new_error = self.kernel.error(patch, self.target.pixels[y0:y1, x0:x1])
+        return self.total_error - int(old_error) + new_error
+
+    def clip(self, box):
+        """
+        Clips a box to the image, returning None if nothing is left.
+        """
+        if box is None:
+            return None
+
+        x0, y0 = max(box[0], 0), max(box[1], 0)
+        x1, y1 = min(box[2], self.width), min(box[3], self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
@@ -14,78 +14,98 @@ Gene mutation options:
     - replace whole polygons
     - change points and colors of polygons
 
+All randomness comes from the np.random.Generator passed in.
 """
 
-from random import randint
-from version_2.gene import Gene
+from version_2.gene import Gene, random_ints
+from version_2.rasterizer import union_box
 
 class Individual:
     """
     Represents a candidate image defined by a set of Polygons.
     """
 
-    def __init__(self, size, genome=None, num_genes=50):
+    def __init__(self, size, genome=None, num_genes=50, rng=None):
         self.size = size
         self.num_genes = num_genes
         self.fitness = -1
+        self.dirty_box = None # region changed by the last mutate(), None if nothing changed
 
-        self.genome = genome if genome else self.random_genome()
+        if not genome and rng is None:
+            raise ValueError("A random genome needs an rng; an unseeded one would make the run irreproducible")
+        self.genome = genome if genome else self.random_genome(rng)
 
-    def random_genome(self):
+    def random_genome(self, rng):
         """
         Generates a random genome for an individual.
         """
         rand_genome = []
 
         for _ in range(self.num_genes):
-            polygon = Gene(self.size)
+            polygon = Gene(self.size, rng=rng)
             rand_genome.append(polygon)
 
         return rand_genome
 
 
-    def mutate(self, gene_mutation_rate):
+    def clone(self):
+        """
+        Copy-on-write clone: the new genome list shares its Genes with this
+        one, and mutate() copies a Gene before changing it.
+        """
+        clone = Individual(self.size, genome=list(self.genome), num_genes=self.num_genes)
+        clone.fitness = self.fitness
+        return clone
+
+    def mutate(self, gene_mutation_rate, rng, color_solver=None):
         """
         Modifies random polygons (Genes) in accordance with the mutation rate.
+        Records the union of the old and new bounding boxes of the mutated
+        genes in dirty_box. With a ColorSolver, a gene whose shape mutated
+        gets the optimal color for its new shape.
         """
         num_mutations = int(self.num_genes * gene_mutation_rate)
-        gene_mutate_indices = []
-
-        for _ in range(num_mutations):
-            gene_idx = randint(0, self.num_genes - 1)
+        self.dirty_box = None
 
-            while gene_idx in gene_mutate_indices:
-                gene_idx = randint(0, self.num_genes - 1)
-            gene_mutate_indices.append(gene_idx)
+        # distinct genes (the first of a random ordering), and how each one mutates
+        gene_mutate_indices = rng.random(self.num_genes).argsort()[:num_mutations].tolist()
+        mutate_types = random_ints(rng, 0, 2, num_mutations)
 
-            gene = self.genome[gene_idx]
+        for gene_idx, mutate_type in zip(gene_mutate_indices, mutate_types):
+            gene = self.genome[gene_idx].copy() # the original may be shared with other clones
+            self.genome[gene_idx] = gene
             #assert isinstance(gene, Gene), f"Expected Gene but got {type(gene)}"
-            self.mutate_gene(gene)
+            old_box = gene.bounding_box()
+            self.mutate_gene(gene, rng, mutate_type)
+            if color_solver and mutate_type != 2: # a new shape gets the best color for it
+                color_solver.solve_gene(self, gene_idx)
+            self.dirty_box = union_box(self.dirty_box, union_box(old_box, gene.bounding_box()))
 
 
-    def mutate_gene(self, gene):
+    def mutate_gene(self, gene, rng, mutate_type=None):
         """
         Modifies a random gene (Polygon) in the genome (Individual) by perturbing
         the vertices and color of a Polygon to a new value within a set radius.
         """
         #assert isinstance(gene, Gene), f"Expected Gene but got {type(gene)}"
 
-        mutate_type = randint(0, 2)
+        if mutate_type is None:
+            mutate_type = int(rng.random() * 3)
         if mutate_type == 0:
-            gene.perturb_vertices()
+            gene.perturb_vertices(rng)
         elif mutate_type == 1:
-            gene.add_vertex()  # should scale with the number of vertices in the polygon
+            gene.add_vertex(rng)  # should scale with the number of vertices in the polygon
         elif mutate_type == 2:
-            gene.perturb_color()
+            gene.perturb_color(rng)
 
-    def replace_gene(self):
+    def replace_gene(self, rng):
         """
         Replaces a random gene (Polygon) in the genome (Individual).
         """
-        gene_index = randint(0, self.num_genes - 1)
+        gene_index = int(rng.random() * self.num_genes)
 
         self.genome.pop(gene_index)
-        self.genome.insert(gene_index, Gene(self.size))
+        self.genome.insert(gene_index, Gene(self.size, rng=rng))
 
     def set_fitness(self, fitness_score):
         self.fitness = fitness_score
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+instrumentation.py
+
+Per-phase timing of GeneticAlgorithm.evolve(). An Instrumentation passed to
+the genetic algorithm splits each generation into phases and records, for
+each one, wall time (perf_counter) and CPU time (process_time) of this
+process:
+    level       pyramid level changes
+    refine      solving the elite's colors (see color_solver.py)
+    clone       cloning the elite
+    mutate      mutating the clones
+    evaluate    scoring the candidates; with the plain serial evaluator
+                also split into render and error
+    sort        ordering the candidates by fitness
+    select      replacing the elite (and confirming sampled winners)
+    snapshot    rendering and queueing the elite's image
+    record      stats, retention, run log and checkpoints
+
+Each generation becomes a record, also holding candidates per second and
+whether the elite improved, and every improvement an event. Both go to
+the sinks: MemorySink (counters and records in memory), FileSink (CSV or
+JSONL) or CallbackSink (any function).
+
+An optional window of generations can be captured with cProfile, and with
+tracemalloc if asked, for a closer look at a few generations.
+
+NOTES:
+    - without an Instrumentation, evolve() only pays a few "is None" checks
+      per generation
+    - with a worker pool, CPU time is this process only; the workers'
+      time shows up as evaluate wall time
+    - evolve() leaves the Instrumentation open, so a run can be continued;
+      close() it after the run to end a capture and close the sinks
+"""
+
+import cProfile
+import csv
+import json
+import pstats
+import time
+import tracemalloc
+
+PHASES = ("level", "refine", "clone", "mutate", "evaluate", "render", "error", "sort", "select", "snapshot", "record")
+SUB_PHASES = ("render", "error") # parts of evaluate, not added to the generation's total
+
+class MemorySink:
+    """
+    Keeps every record and event, and running totals per phase.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.events = []
+        self.wall = dict.fromkeys(PHASES, 0.0) # total seconds per phase
+        self.cpu = dict.fromkeys(PHASES, 0.0)
+
+    def record(self, kind, data):
+        if kind == "generation":
+            self.records.append(data)
+            for phase in PHASES:
+                self.wall[phase] += data[f"{phase}_wall"]
+                self.cpu[phase] += data[f"{phase}_cpu"]
+        else:
+            self.events.append(data)
+
+    def summary(self):
+        """
+        Share of the total wall time spent in each phase.
+
+        Returns:
+            (dict): Fraction of generation wall time per phase (render and
+            error are fractions of the same total, inside evaluate).
+        """
+        total = sum(seconds for phase, seconds in self.wall.items() if phase not in SUB_PHASES)
+        return {phase: seconds / total if total else 0.0 for phase, seconds in self.wall.items()}
+
+    def close(self):
+        pass
+
+class FileSink:
+    """
+    Streams records to a CSV file (generations only) or a JSONL file
+    (generations and events, each with a "type"), chosen by the extension.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): A .csv or .jsonl file, replaced if it exists.
+        """
+        if not path.endswith((".csv", ".jsonl")):
+            raise ValueError(f"FileSink writes .csv or .jsonl files: {path}")
+        self.path = path
+        self.file = open(path, "w", newline="")
+        self.writer = None # CSV writer, created with the first record
+
+    def record(self, kind, data):
+        if self.path.endswith(".jsonl"):
+            self.file.write(json.dumps(dict(data, type=kind)) + "\n")
+        elif kind == "generation":
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(data))
+                self.writer.writeheader()
+            self.writer.writerow(data)
+
+    def close(self):
+        self.file.close()
+
+class CallbackSink:
+    """
+    Calls a function with every record and event: function(kind, data),
+    where kind is "generation" or "improvement".
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def record(self, kind, data):
+        self.function(kind, data)
+
+    def close(self):
+        pass
+
+class Instrumentation:
+    """
+    Times the phases of each generation and hands the results to sinks.
+    """
+
+    def __init__(self, sinks=None, profile_generations=None, profile_path="./polyevolve_profile",
+                 trace_memory=False):
+        """
+        Args:
+            sinks (list): Sinks receiving the records, a MemorySink if None.
+            profile_generations (tuple): (first, last) generation numbers to capture
+                with cProfile, inclusive. None disables profiling.
+            profile_path (str): Path prefix of the captures: <path>.prof (cProfile,
+                for pstats or snakeviz), <path>.txt (top functions) and, with
+                trace_memory, <path>.memory.txt (top allocation sites).
+            trace_memory (bool): Also trace allocations with tracemalloc in the window.
+        """
+        self.sinks = sinks if sinks else [MemorySink()]
+        self.profile_generations = profile_generations
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+
+        self.profiler = None
+        self.generation = None
+        self.wall = dict.fromkeys(PHASES, 0.0) # seconds per phase of the current generation
+        self.cpu = dict.fromkeys(PHASES, 0.0)
+        self.last_wall = 0.0
+        self.last_cpu = 0.0
+        self.start_wall = 0.0
+        self.start_cpu = 0.0
+
+    def start_generation(self, generation):
+        """
+        Starts timing a generation (numbered from 1).
+        """
+        if self.profile_generations and generation == self.profile_generations[0]:
+            self.start_profile()
+
+        self.generation = generation
+        self.wall = dict.fromkeys(PHASES, 0.0)
+        self.cpu = dict.fromkeys(PHASES, 0.0)
+        self.start_wall = self.last_wall = time.perf_counter()
+        self.start_cpu = self.last_cpu = time.process_time()
+
+    def mark(self, phase):
+        """
+        Ends a phase: the time since the previous mark (or the start of the
+        generation) is added to it.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.wall[phase] += wall - self.last_wall
+        self.cpu[phase] += cpu - self.last_cpu
+        self.last_wall = wall
+        self.last_cpu = cpu
+
+    def add(self, phase, wall, cpu=0.0):
+        """
+        Adds time measured elsewhere (e.g. by the evaluator) to a sub-phase.
+        """
+        self.wall[phase] += wall
+        self.cpu[phase] += cpu
+
+    def end_generation(self, num_candidates, improved, elite_fitness):
+        """
+        Finishes the generation and sends its record to the sinks.
+
+        Args:
+            num_candidates (int): Candidates scored in the generation.
+            improved (bool): Whether the elite improved.
+            elite_fitness (float): Fitness of the elite after the generation.
+        """
+        total_wall = time.perf_counter() - self.start_wall
+        total_cpu = time.process_time() - self.start_cpu
+
+        data = {"generation": self.generation}
+        for phase in PHASES:
+            data[f"{phase}_wall"] = self.wall[phase]
+            data[f"{phase}_cpu"] = self.cpu[phase]
+        data["total_wall"] = total_wall
+        data["total_cpu"] = total_cpu
+        data["candidates"] = num_candidates
+        data["candidates_per_second"] = num_candidates / total_wall if total_wall > 0 else 0.0
+        data["improved"] = bool(improved)
+        data["elite_fitness"] = float(elite_fitness)
+        for sink in self.sinks:
+            sink.record("generation", data)
+
+        if self.profiler and self.generation >= self.profile_generations[1]:
+            self.stop_profile()
+
+    def improvement(self, previous_fitness, fitness):
+        """
+        Records an elite improvement event in the current generation.
+        """
+        data = {"generation": self.generation, "previous_fitness": float(previous_fitness),
+                "fitness": float(fitness)}
+        for sink in self.sinks:
+            sink.record("improvement", data)
+
+    def start_profile(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self):
+        """
+        Stops the capture and writes it out.
+        """
+        self.profiler.disable()
+        self.profiler.dump_stats(self.profile_path + ".prof")
+        with open(self.profile_path + ".txt", "w") as file:
+            pstats.Stats(self.profiler, stream=file).sort_stats("cumulative").print_stats(40)
+        self.profiler = None
+
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            with open(self.profile_path + ".memory.txt", "w") as file:
+                for stat in snapshot.statistics("lineno")[:40]:
+                    file.write(f"{stat}\n")
+
+    def close(self):
+        """
+        Ends a capture cut short by the end of the run and closes the sinks.
+        """
+        if self.profiler:
+            self.stop_profile()
+        for sink in self.sinks:
+            sink.close()
+
+    def memory(self):
+        """
+        The first MemorySink, if there is one.
+        """
+        for sink in self.sinks:
+            if isinstance(sink, MemorySink):
+                return sink
+        return None
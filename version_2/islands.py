@@ -0,0 +1,247 @@
+"""
+islands.py
+
+Island-model evolution: several independent GeneticAlgorithm runs (islands)
+on the same target, each in its own process with its own random stream,
+that exchange their elites every migration_interval generations.
+
+Each island evolves for an epoch of migration_interval generations and
+sends its elite (genome_format.py) to the parent. The parent routes the
+elites along the topology and every island then decides, by the
+replacement policy, whether a migrant replaces its elite.
+
+Topologies:
+    "ring"  - island i receives the elite of island i - 1
+    "full"  - every island receives the elites of all the others
+
+Replacement policies (applied to the fittest migrant an island receives):
+    "better"    - replaces the elite if it is fitter
+    "always"    - replaces the elite unconditionally
+    "none"      - islands never adopt migrants (independent runs)
+
+NOTES:
+    - migration is synchronous, so a seeded run gives the same result
+      however the processes are scheduled
+    - a migrant is re-scored by the receiving island before it is compared,
+      so islands may be at different pyramid levels
+    - every generation of every island prints its "Generation N" line
+"""
+
+import os
+import time
+import numpy as np
+from multiprocessing import Pipe, Process
+from version_2 import genome_format
+from version_2.genetic_algorithm import GeneticAlgorithm
+from version_2.pyramid import rescale
+from version_2.snapshot_writer import SnapshotWriter
+from version_2.stats import StatsHistory
+
+TOPOLOGIES = ("ring", "full")
+REPLACEMENT_POLICIES = ("better", "always", "none")
+
+class IslandModel:
+    """
+    Runs and coordinates a set of islands.
+    """
+
+    def __init__(self, target, num_islands=4, migration_interval=50, topology="ring", replacement="better",
+                 num_generations=2000, population_size=50, seed=None, snapshot_directory=None, **options):
+        """
+        Args:
+            target (Image): The target image.
+            num_islands (int): Number of islands, one process each.
+            migration_interval (int): Generations between migrations.
+            topology (str): Where elites migrate to, see the module notes.
+            replacement (str): When a migrant replaces an elite, see the module notes.
+            num_generations (int): Generations each island runs.
+            population_size (int): Candidates per generation on each island.
+            seed (int): Seed the islands' random streams are derived from.
+            snapshot_directory (str): If given, each island writes the images of its
+                improved elites to a subdirectory island_<i>.
+            options: Further GeneticAlgorithm arguments for every island
+                (render_backend, incremental, early_exit, pyramid, sample,
+                num_workers; each island then runs its own worker pool).
+        """
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology: {topology}")
+        if replacement not in REPLACEMENT_POLICIES:
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        if num_islands < 2 and topology == "ring":
+            raise ValueError("A ring needs at least two islands")
+
+        self.target = target
+        self.num_islands = num_islands
+        self.migration_interval = migration_interval
+        self.topology = topology
+        self.replacement = replacement
+        self.num_generations = num_generations
+        self.population_size = population_size
+        self.snapshot_directory = snapshot_directory
+        self.options = options
+
+        # one independent stream per island: the spawned SeedSequences themselves seed the islands' generators
+        self.seeds = np.random.SeedSequence(seed).spawn(num_islands)
+
+        self.stats = [StatsHistory() for _ in range(num_islands)] # statistics of every island
+        self.elites = [None] * num_islands # latest elite of every island
+        self.migrations = [0] * num_islands # migrants each island adopted
+        self.wall_time = 0 # seconds evolve() took
+
+    def sources(self, island):
+        """
+        The islands whose elites migrate to an island.
+        """
+        if self.topology == "ring":
+            return [(island - 1) % self.num_islands]
+        return [i for i in range(self.num_islands) if i != island]
+
+    def evolve(self):
+        """
+        Runs every island to num_generations, migrating between epochs.
+
+        Returns:
+            (Individual): The fittest elite across the islands.
+        """
+        start_time = time.perf_counter()
+        connections = []
+        processes = []
+        for island in range(self.num_islands):
+            parent_end, child_end = Pipe()
+            process = Process(target=run_island, name=f"island-{island}",
+                              args=(child_end, island, self.target, self.seeds[island], self.num_generations,
+                                    self.population_size, self.migration_interval, self.replacement,
+                                    self.snapshot_directory, self.options))
+            process.start()
+            child_end.close()
+            connections.append(parent_end)
+            processes.append(process)
+
+        finished = False
+        try:
+            done = 0
+            while done < self.num_generations:
+                # collect the elite and new stats of every island
+                migrants = []
+                for island, connection in enumerate(connections):
+                    data, fitness, size, stats, adopted = connection.recv()
+                    self.stats[island].extend(stats)
+                    self.migrations[island] += adopted
+                    self.elites[island] = (data, fitness, size)
+                    migrants.append((data, size))
+                done = len(self.stats[0])
+
+                # route the elites, or tell the islands to stop
+                for island, connection in enumerate(connections):
+                    if done < self.num_generations and self.replacement != "none":
+                        connection.send([migrants[source] for source in self.sources(island)])
+                    else:
+                        connection.send([] if done < self.num_generations else None)
+            finished = True
+        finally:
+            # the islands are not daemonic, so that they can start worker pools of their own;
+            # after a failure they are stopped here rather than left running an epoch
+            for connection in connections:
+                connection.close()
+            for process in processes:
+                if not finished:
+                    process.terminate()
+                process.join()
+            self.wall_time = time.perf_counter() - start_time
+
+        return self.best()
+
+    def best(self):
+        """
+        The fittest elite across the islands.
+
+        Returns:
+            (Individual): The elite, or None before evolve().
+        """
+        if self.elites[0] is None:
+            return None
+        data, fitness, size = max(self.elites, key=lambda elite: elite[1])
+        individual = genome_format.decode(data, size)
+        individual.set_fitness(fitness)
+        return individual
+
+    def global_stats(self):
+        """
+        Per-generation summary across the islands.
+
+        Returns:
+            (list): A (generation, best elite fitness, mean elite fitness, best island)
+            tuple per generation.
+        """
+        length = min(len(stats) for stats in self.stats)
+        fitnesses = np.stack([stats.column("elite_fitness")[:length] for stats in self.stats])
+        best = fitnesses.argmax(axis=0)
+        generations = self.stats[0].column("generation")[:length]
+        return list(zip(generations.tolist(), fitnesses.max(axis=0).tolist(), fitnesses.mean(axis=0).tolist(),
+                        best.tolist()))
+
+    def report(self):
+        """
+        Prints the final elite of every island and of the whole model.
+        """
+        print(f"{'island':>8} {'elite fitness':>14} {'vertices':>9} {'adopted':>8} {'seconds':>8}")
+        for island, stats in enumerate(self.stats):
+            last = stats[-1]
+            seconds = stats.column("wall_time").sum()
+            print(f"{island:>8} {last.elite_fitness:>14.2f} {last.elite_vertices:>9} "
+                  f"{self.migrations[island]:>8} {seconds:>8.2f}")
+        generation, best, mean, island = self.global_stats()[-1]
+        print(f"{'global':>8} {best:>14.2f}   (island {island}, mean elite {mean:.2f}, "
+              f"{self.wall_time:.2f} s wall)")
+
+def run_island(connection, island, target, seed, num_generations, population_size, migration_interval,
+               replacement, snapshot_directory, options):
+    """
+    Body of an island process: evolves an epoch, reports, takes migrants,
+    and repeats until the parent sends None.
+
+    Args:
+        connection (Connection): This island's end of the pipe to the parent.
+        island (int): Index of the island.
+        (the rest as in IslandModel)
+    """
+    if snapshot_directory:
+        writer = SnapshotWriter(os.path.join(snapshot_directory, f"island_{island}"), policy="improved")
+    else:
+        writer = SnapshotWriter(policy="none")
+
+    gen_alg = GeneticAlgorithm(target, snapshot_writer=writer, seed=seed, **options)
+    gen_alg.population_size = population_size
+
+    adopted = 0
+    try:
+        while True:
+            reported = len(gen_alg.stats)
+            gen_alg.num_generations = min(gen_alg.generations_done + migration_interval, num_generations)
+            gen_alg.evolve(keep_evaluator=True) # one evaluator (pool, sample) for every epoch
+
+            elite = gen_alg.elite_individual
+            connection.send((genome_format.encode(elite), elite.fitness, elite.size,
+                             gen_alg.stats[reported:].copy(), adopted))
+            adopted = 0
+
+            migrants = connection.recv()
+            if migrants is None:
+                break
+
+            # score the migrants here, at this island's resolution, and keep the fittest
+            best = None
+            for data, size in migrants:
+                migrant = genome_format.decode(data, size)
+                if tuple(size) != tuple(gen_alg.target_size):
+                    migrant = rescale(migrant, gen_alg.target_size)
+                migrant.set_fitness(gen_alg.evaluate_fitness_mse(migrant))
+                if best is None or migrant.fitness > best.fitness:
+                    best = migrant
+
+            if best is not None and (replacement == "always" or best.fitness > elite.fitness):
+                gen_alg.elite_individual = best
+                adopted = 1
+    finally:
+        gen_alg.close_evaluator()
+        connection.close()
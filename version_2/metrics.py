@@ -0,0 +1,256 @@
+"""
+metrics.py
+
+The fitness metrics an Evaluator can score candidates with, by name:
+    "ssd"       - mean squared error (MSE) in RGB, the default
+    "sad"       - mean absolute error in RGB (version 1's evaluate_fitness_abs_diff)
+    "weighted"  - mean squared error with per-channel weights
+    "delta_e"   - mean CIE76 color difference (Delta E) in CIE Lab
+    "ssim"      - 1 - SSIM of the luma channel
+    "ms_ssim"   - 1 - multi-scale SSIM of the luma channel
+
+A metric is built once per target (make_metric()), when everything that
+depends only on the target is computed: its Lab coordinates, and the
+luma, window means and variances of each SSIM scale. Scoring a candidate
+then only transforms the candidate, fully vectorized, into reused buffers.
+SSIM windows are summed with integral images (summed-area tables), so the
+cost per pixel does not depend on the window size.
+
+Every metric has error(pixels), lower is better, for a (height, width, 3)
+uint8 render, and max_error, an upper bound of error(). Fitness is
+max_error - error.
+
+NOTES:
+    - SSIM uses uniform square windows (not a Gaussian) and population
+      variances, over the windows that fit entirely in the image
+    - MS-SSIM uses as many of the five standard scales as the image allows;
+      negative contrast-structure terms are clamped to 0
+    - incremental rendering, early exit and sampled fitness only support
+      the first three metrics
+"""
+
+import numpy as np
+from version_2.error_kernels import ErrorKernel
+
+# sRGB (D65) -> linear RGB, one entry per 8-bit value
+CODES = np.arange(256) / 255
+LINEAR = np.where(CODES <= .04045, CODES / 12.92, ((CODES + .055) / 1.055) ** 2.4).astype(np.float32)
+
+# linear RGB -> XYZ, each row divided by the D65 white point
+TO_XYZ = (np.array([[.4124564, .3575761, .1804375],
+                    [.2126729, .7151522, .0721750],
+                    [.0193339, .1191920, .9503041]]) / np.array([[.95047], [1.], [1.08883]])).astype(np.float32)
+
+# f(X), f(Y), f(Z) -> L, a, b (without L's constant offset, which cancels in differences)
+TO_LAB = np.array([[0, 116, 0],
+                   [500, -500, 0],
+                   [0, 200, -200]], dtype=np.float32)
+
+LAB_EPSILON = (6 / 29) ** 3
+LAB_SLOPE = 1 / (3 * (6 / 29) ** 2)
+MAX_DELTA_E = 375.6 # sqrt(100^2 + 256^2 + 256^2), a bound on Lab distances of 8-bit colors
+
+LUMA = np.array([.299, .587, .114]) # Rec. 601
+SSIM_C1 = (.01 * 255) ** 2
+SSIM_C2 = (.03 * 255) ** 2
+MS_SSIM_WEIGHTS = (.0448, .2856, .3001, .2363, .1333) # finest scale first
+
+class KernelMetric:
+    """
+    A per-pixel RGB error computed by an ErrorKernel (see error_kernels.py).
+    """
+
+    name = None
+
+    def __init__(self, target, weights=None):
+        """
+        Args:
+            target (Target): The prepared target image.
+            weights (tuple): Per-channel weights, for the weighted metric.
+        """
+        self.target = target
+        self.kernel = ErrorKernel(target.size, self.name, weights)
+
+    def error(self, pixels):
+        return self.kernel.mean_error(pixels, self.target.pixels)
+
+class SquaredError(KernelMetric):
+    name = "ssd"
+    max_error = 3 * 255 ** 2
+
+class AbsoluteError(KernelMetric):
+    name = "sad"
+    max_error = 3 * 255
+
+class WeightedSquaredError(KernelMetric):
+    name = "weighted"
+
+    def __init__(self, target, weights=None):
+        super().__init__(target, weights)
+        self.max_error = 255 ** 2 * sum(self.kernel.weights)
+
+class DeltaE:
+    """
+    Mean CIE76 Delta E: the Euclidean distance in CIE Lab, where distances
+    follow perceived color differences much better than in RGB.
+    """
+
+    max_error = MAX_DELTA_E
+
+    def __init__(self, target):
+        """
+        Args:
+            target (Target): The prepared target image.
+        """
+        count = target.num_pixels
+        self.linear = np.empty((count, 3), dtype=np.float32) # scratch buffers, reused by every candidate
+        self.xyz = np.empty((count, 3), dtype=np.float32)
+        self.f = np.empty((count, 3), dtype=np.float32)
+        self.target_f = self.transform(target.pixels).copy() # f(X), f(Y), f(Z) of the target
+
+    def transform(self, pixels):
+        """
+        f(X), f(Y), f(Z) of an image, the nonlinear part of the Lab
+        conversion, into the f buffer.
+        """
+        np.take(LINEAR, pixels.reshape(-1, 3), out=self.linear)
+        np.matmul(self.linear, TO_XYZ.T, out=self.xyz)
+        np.cbrt(self.xyz, out=self.f)
+        np.copyto(self.f, self.xyz * LAB_SLOPE + 4 / 29, where=self.xyz <= LAB_EPSILON)
+        return self.f
+
+    def error(self, pixels):
+        f = self.transform(pixels)
+        np.subtract(f, self.target_f, out=f)
+        lab = np.matmul(f, TO_LAB.T, out=self.xyz) # differences in L, a and b
+        np.multiply(lab, lab, out=lab)
+        return float(np.sqrt(lab.sum(axis=1)).mean())
+
+class StructuralSimilarity:
+    """
+    1 - SSIM of the luma channel. SSIM compares local means (luminance),
+    variances (contrast) and covariances (structure) over small windows,
+    so it rewards reproducing edges and texture rather than matching each
+    pixel's color.
+    """
+
+    def __init__(self, target, window=7, num_scales=1, scale_weights=(1.,)):
+        """
+        Args:
+            target (Target): The prepared target image.
+            window (int): Side of the square windows, in pixels.
+            num_scales (int): Most scales to compare, each half the size of the previous one.
+            scale_weights (tuple): Exponent of each scale, finest first.
+        """
+        height, width = target.pixels.shape[:2]
+        if min(height, width) < window:
+            raise ValueError(f"SSIM needs an image of at least {window}x{window} pixels")
+        count = 1
+        while count < num_scales and min(height, width) >> count >= window:
+            count += 1
+
+        weights = np.array(scale_weights[:count])
+        self.scale_weights = weights / weights.sum()
+        self.window = window
+        self.max_error = 2. if count == 1 else 1. # a single SSIM ranges over [-1, 1]
+
+        # per scale, finest first: target luma, window means, and the target's terms of the formula
+        self.levels = []
+        luma = target.pixels @ LUMA
+        for scale in range(count):
+            if scale:
+                luma = downsample(luma)
+            stack = np.stack([luma, luma * luma])
+            means, squares = window_sums(stack, window, np.empty((2, luma.shape[0] + 1, luma.shape[1] + 1)))
+            means /= window * window
+            variances = squares / (window * window) - means * means
+            integral = np.empty((3, luma.shape[0] + 1, luma.shape[1] + 1)) # reused for the candidates
+            self.levels.append((luma, means, means * means + SSIM_C1, variances + SSIM_C2, integral))
+
+    def error(self, pixels):
+        luma = pixels @ LUMA
+        similarity = 1.
+        for scale, (target_luma, target_means, luminance_term, contrast_term, integral) in enumerate(self.levels):
+            if scale:
+                luma = downsample(luma)
+            area = self.window * self.window
+            sums = window_sums(np.stack([luma, luma * luma, luma * target_luma]), self.window, integral)
+            means = sums[0] / area
+            variances = sums[1] / area - means * means
+            covariances = sums[2] / area - means * target_means
+
+            value = (2 * covariances + SSIM_C2) / (variances + contrast_term)
+            if scale == len(self.levels) - 1:
+                value *= (2 * means * target_means + SSIM_C1) / (means * means + luminance_term)
+            value = value.mean()
+
+            if len(self.levels) == 1:
+                return float(max(1 - value, 0.)) # rounding can push the SSIM of identical images past 1
+            similarity *= max(value, 0.) ** self.scale_weights[scale]
+        return float(max(1 - similarity, 0.))
+
+class MultiScaleSSIM(StructuralSimilarity):
+    """
+    1 - MS-SSIM: contrast and structure compared at up to five scales,
+    luminance at the coarsest one.
+    """
+
+    def __init__(self, target, window=7):
+        super().__init__(target, window, len(MS_SSIM_WEIGHTS), MS_SSIM_WEIGHTS)
+
+METRICS = {
+    "ssd": SquaredError,
+    "sad": AbsoluteError,
+    "weighted": WeightedSquaredError,
+    "delta_e": DeltaE,
+    "ssim": StructuralSimilarity,
+    "ms_ssim": MultiScaleSSIM,
+}
+KERNEL_METRICS = ("ssd", "sad", "weighted")
+
+def make_metric(name, target, weights=None):
+    """
+    Builds a metric of METRICS for a target.
+
+    Args:
+        name (str): The metric's name.
+        target (Target): The prepared target image.
+        weights (tuple): Per-channel weights, for "weighted" only.
+
+    Returns:
+        The metric, with error(pixels) and max_error.
+    """
+    if name not in METRICS:
+        raise ValueError(f"Unknown fitness metric: {name}")
+    if name in KERNEL_METRICS:
+        return METRICS[name](target, weights)
+    return METRICS[name](target)
+
+def window_sums(stack, window, integral):
+    """
+    Sums of every window x window square of each image in a stack, read
+    from integral images: four lookups per window, whatever its size.
+
+    Args:
+        stack (ndarray): (n, height, width) images.
+        window (int): Side of the windows.
+        integral (ndarray): (n, height + 1, width + 1) float64 scratch.
+
+    Returns:
+        (ndarray): (n, height - window + 1, width - window + 1) window sums.
+    """
+    integral[:, 0] = 0
+    integral[:, :, 0] = 0
+    inner = integral[:, 1:, 1:]
+    np.cumsum(stack, axis=1, out=inner)
+    np.cumsum(inner, axis=2, out=inner)
+    return (integral[:, window:, window:] - integral[:, :-window, window:]
+            - integral[:, window:, :-window] + integral[:, :-window, :-window])
+
+def downsample(image):
+    """
+    Halves an image by averaging 2x2 blocks (an odd last row or column is dropped).
+    """
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    image = image[:height, :width]
+    return (image[0::2, 0::2] + image[1::2, 0::2] + image[0::2, 1::2] + image[1::2, 1::2]) / 4
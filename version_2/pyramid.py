@@ -0,0 +1,107 @@
+"""
+pyramid.py
+
+A Pyramid is the target at several resolutions, for coarse-to-fine
+evolution: the genetic algorithm starts on a small copy of the target,
+where each candidate costs a fraction of the pixels, and moves to the next
+finer level on a schedule or when progress stalls. The last level is the
+full-resolution target.
+
+Moving to a finer level rescales the elite through normalized coordinates:
+a vertex (x, y) on a width x height level becomes
+(x / width * new_width, y / height * new_height), rounded to whole pixels.
+
+NOTES:
+    - the levels are downsampled once, with a box filter
+    - fitness is only comparable between generations of the same level
+"""
+
+from PIL import Image
+from version_2.evaluator import MAX_POSSIBLE_MSE
+from version_2.gene import Gene
+from version_2.individual import Individual
+from version_2.target import Target
+
+class Pyramid:
+    """
+    Represents the target image at successively finer resolutions.
+    """
+
+    def __init__(self, image, num_levels=3, factor=2, schedule=None, stall_generations=50, min_improvement=.02):
+        """
+        Args:
+            image (Image): The full-resolution Pillow image to be approximated.
+            num_levels (int): Number of levels, including full resolution.
+            factor (int): Downsampling factor between neighbouring levels.
+            schedule (list): Generations to spend on each level but the last.
+                If None, a level is left when it stalls instead.
+            stall_generations (int): Generations over which progress is measured.
+            min_improvement (float): Fraction by which the elite's MSE must fall over
+                stall_generations for the level not to count as stalled.
+        """
+        if schedule is not None and len(schedule) != num_levels - 1:
+            raise ValueError("The schedule needs one entry per level except the last")
+
+        self.schedule = schedule
+        self.stall_generations = stall_generations
+        self.min_improvement = min_improvement
+
+        width, height = image.size
+        self.images = []
+        for level in reversed(range(num_levels)):
+            scale = factor ** level
+            size = (max(1, width // scale), max(1, height // scale))
+            self.images.append(image if scale == 1 else image.convert("RGBA").resize(size, Image.Resampling.BOX))
+
+        # coarsest first
+        self.targets = [Target(level_image) for level_image in self.images]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def size(self, level):
+        return self.targets[level].size
+
+    def advance(self, level, stats, level_start, max_error=MAX_POSSIBLE_MSE):
+        """
+        Whether to move from a level to the next finer one.
+
+        Args:
+            level (int): The current level (0 is the coarsest).
+            stats (StatsHistory): Statistics of the run so far.
+            level_start (int): Number of generations that ran before this level.
+            max_error (float): The fitness metric's max_error, which fitness is measured down from.
+        """
+        if level >= len(self.targets) - 1:
+            return False
+
+        done = len(stats) - level_start
+        if self.schedule is not None:
+            return done >= self.schedule[level]
+
+        if done <= self.stall_generations:
+            return False
+        before = max_error - stats[-1 - self.stall_generations].elite_fitness
+        after = max_error - stats[-1].elite_fitness
+        return before - after <= self.min_improvement * before
+
+def rescale(individual, size):
+    """
+    Copies an Individual onto a canvas of another size.
+
+    Args:
+        individual (Individual): The individual to rescale.
+        size (tuple): (width, height) of the new canvas.
+
+    Returns:
+        (Individual): The rescaled individual, not yet evaluated.
+    """
+    old_width, old_height = individual.size
+    width, height = size
+
+    genome = []
+    for gene in individual.genome:
+        vertices = [(round(x / old_width * width), round(y / old_height * height)) for x, y in gene.vertices]
+        genome.append(Gene(size, vertices=vertices, color=gene.color))
+
+    return Individual(size, genome=genome, num_genes=individual.num_genes)
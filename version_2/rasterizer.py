@@ -0,0 +1,223 @@
+"""
+rasterizer.py
+
+Single-canvas rendering backend ("inplace") used by image_renderer.py.
+
+Every polygon is drawn straight onto one RGB image with Pillow's scanline
+filler in blend mode, so only the pixels it covers are touched, in C, with
+no per-gene layer and no full-frame composite. The blend is
+round((src * a + dst * (255 - a)) / 255) in the same fixed point as
+Pillow's alpha_composite onto an opaque background, so the output is
+pixel-identical to the "pillow" backend.
+
+Regions and sampled rows are rendered with the polygons moved up by the
+first row: scanline crossings depend only on row differences, so they are
+drawn exactly as in a full render, but rows above the region cost nothing.
+Coverage masks are drawn the same way, and composite() blends them with
+that arithmetic in NumPy, for callers that work on masks (color_solver.py).
+
+NOTES:
+    - renders are (height, width, 3) uint8 arrays; only the canvases of
+      new_canvas() and composite(), which color_solver.py works on, are
+      planar (3, height, width) uint16 arrays holding 0-255 values, so each
+      channel of a box is one strided block
+    - the background is opaque
+    - vertices are non-negative integer pixel coordinates, as Gene produces them
+    - moving polygons sideways changes Pillow's float rounding, so regions
+      are drawn from column 0 and cropped
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+def new_canvas(size, background=(0, 0, 0)):
+    """
+    Creates an opaque RGB canvas.
+
+    Args:
+        size (tuple): (width, height) of the canvas.
+        background (tuple): RGB background color.
+
+    Returns:
+        (ndarray): A (3, height, width) uint16 array.
+    """
+    canvas = np.empty((3, size[1], size[0]), dtype=np.uint16)
+    canvas[:] = np.asarray(background, dtype=np.uint16)[:, None, None]
+    return canvas
+
+def polygon_bbox(vertices, width, height):
+    """
+    Finds the bounding box of a polygon clipped to the canvas.
+
+    Args:
+        vertices (list): (x, y) tuples of the polygon points.
+        width (int): canvas width.
+        height (int): canvas height.
+
+    Returns:
+        (tuple): (x0, y0, x1, y1) with exclusive ends, or None if the polygon is off canvas.
+    """
+    xs = [v[0] for v in vertices]
+    ys = [v[1] for v in vertices]
+    x0 = max(int(np.floor(min(xs))), 0)
+    y0 = max(int(np.floor(min(ys))), 0)
+    x1 = min(int(np.ceil(max(xs))) + 1, width)
+    y1 = min(int(np.ceil(max(ys))) + 1, height)
+
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+def draw_genes(image, genes, top=0):
+    """
+    Blends genes in order onto an RGB image, in place.
+
+    Args:
+        image (Image): "RGB" image whose first row is image row `top`.
+        genes (iterable): Genes, drawn in order.
+        top (int): Image row of the first row of the image.
+    """
+    draw = ImageDraw.Draw(image, "RGBA") # RGBA ink on an RGB image blends instead of replacing
+    for gene in genes:
+        vertices = [(x, y - top) for x, y in gene.vertices] if top else gene.vertices
+        draw.polygon(vertices, fill=gene.color)
+
+def render_rgb(size, genes, background=(0, 0, 0)):
+    """
+    Renders a sequence of genes as an interleaved image.
+
+    Args:
+        size (tuple): (width, height) of the image.
+        genes (iterable): Genes, drawn in order.
+        background (tuple): RGB background color.
+
+    Returns:
+        (ndarray): A read-only (height, width, 3) uint8 array.
+    """
+    image = Image.new("RGB", tuple(size), tuple(background))
+    draw_genes(image, genes)
+    return np.asarray(image)
+
+def polygon_mask(vertices, box):
+    """
+    Scan-converts a polygon into a coverage mask over a box, exactly as
+    Pillow fills it.
+
+    Args:
+        vertices (list or ndarray): (x, y) points of the polygon.
+        box (tuple): (x0, y0, x1, y1) region to rasterize, exclusive ends.
+
+    Returns:
+        (ndarray): A (y1 - y0, x1 - x0) boolean mask.
+    """
+    x0, y0, x1, y1 = box
+    image = Image.new("L", (x1, y1 - y0))
+    ImageDraw.Draw(image).polygon([(x, y - y0) for x, y in vertices], fill=1)
+    return np.asarray(image.crop((x0, 0, x1, y1 - y0))).view(bool)
+
+def composite(canvas, mask, color, box):
+    """
+    Alpha-blends a color into the canvas wherever the mask is set, in place.
+
+    Pillow computes round((src * a + dst * (255 - a)) / 255) in fixed point;
+    (v + 128 + ((v + 128) >> 8)) >> 8 gives the same result for every
+    v <= 255 * 255, and every intermediate fits in uint16.
+
+    Args:
+        canvas (ndarray): (3, height, width) uint16 canvas.
+        mask (ndarray): boolean coverage mask for the box.
+        color (tuple): RGBA color of the polygon.
+        box (tuple): (x0, y0, x1, y1) position of the mask on the canvas.
+    """
+    x0, y0, x1, y1 = box
+    alpha = color[3]
+    if alpha == 0:
+        return
+
+    region = canvas[:, y0:y1, x0:x1]
+    coverage = mask.view(np.uint8) * np.uint16(alpha) # alpha where covered, 0 elsewhere
+    source = np.asarray(color[:3], dtype=np.uint16)[:, None, None]
+
+    # blend in a contiguous temporary, strided in-place passes are much slower
+    blended = region * (255 - coverage)
+    blended += coverage * source
+    blended += 128
+    blended += blended >> 8
+    blended >>= 8
+    region[...] = blended
+
+def render_region(box, genes, background=(0, 0, 0)):
+    """
+    Renders only part of the image. Genes that do not reach the region are
+    skipped and rows above it are not drawn, so the cost follows the region.
+
+    Args:
+        box (tuple): (x0, y0, x1, y1) region of the image, exclusive ends.
+        genes (iterable): Genes, drawn in order.
+        background (tuple): RGB background color.
+
+    Returns:
+        (ndarray): A read-only (y1 - y0, x1 - x0, 3) uint8 array.
+    """
+    x0, y0, x1, y1 = box
+    image = Image.new("RGB", (x1, y1 - y0), tuple(background))
+    draw_genes(image, [gene for gene in genes if overlaps(gene.vertices, box)], top=y0)
+    return np.asarray(image.crop((x0, 0, x1, y1 - y0)))
+
+def render_rows(size, rows, genes, background=(0, 0, 0)):
+    """
+    Renders only some rows of the image, e.g. a sample of them. Rows
+    above the first and below the last sampled row are not drawn.
+
+    Args:
+        size (tuple): (width, height) of the image.
+        rows (ndarray): Sorted image row indices.
+        genes (iterable): Genes, drawn in order.
+        background (tuple): RGB background color.
+
+    Returns:
+        (ndarray): A (len(rows), width, 3) uint8 array, one row per sampled row.
+    """
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    box = (0, top, size[0], bottom)
+    image = Image.new("RGB", (size[0], bottom - top), tuple(background))
+    draw_genes(image, [gene for gene in genes if overlaps(gene.vertices, box)], top=top)
+    return np.asarray(image)[rows - top]
+
+def render_arrays(size, vertices, counts, colors, background=(0, 0, 0)):
+    """
+    Renders one member of a GenerationArrays without building Gene objects.
+
+    Args:
+        size (tuple): (width, height) of the canvas.
+        vertices (ndarray): (genes, max_vertices, 2) padded vertex coordinates.
+        counts (ndarray): (genes,) number of vertices in use.
+        colors (ndarray): (genes, 4) RGBA colors.
+        background (tuple): RGB background color.
+
+    Returns:
+        (ndarray): A read-only (height, width, 3) uint8 array.
+    """
+    image = Image.new("RGB", tuple(size), tuple(background))
+    draw = ImageDraw.Draw(image, "RGBA")
+    for points, count, color in zip(vertices.tolist(), counts.tolist(), colors.tolist()):
+        draw.polygon([tuple(point) for point in points[:count]], fill=tuple(color))
+    return np.asarray(image)
+
+def overlaps(vertices, box):
+    """
+    Whether a polygon's bounding box reaches a box with exclusive ends.
+    """
+    xs = [v[0] for v in vertices]
+    ys = [v[1] for v in vertices]
+    return max(xs) >= box[0] and min(xs) < box[2] and max(ys) >= box[1] and min(ys) < box[3]
+
+def union_box(a, b):
+    """
+    Smallest box containing both boxes; either may be None.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
@@ -0,0 +1,219 @@
+"""
+run_log.py
+
+An append-only log of a run: one record per elite improvement, holding the
+generation, the fitness, the canvas size and the packed genome
+(genome_format.py). A few hundred bytes per record instead of a PNG per
+generation, and any generation's elite can be rebuilt, replayed or
+re-rendered at any resolution afterwards.
+
+Layout (little endian):
+    file header:    b"PERL", uint8 format version
+    each record:    uint32 payload length, then the payload:
+                        varint      generation
+                        float64     fitness
+                        varint      canvas width
+                        varint      canvas height
+                        bytes       packed genome
+
+NOTES:
+    - RunLogReader memory-maps the file and indexes the records once
+    - a record cut short by a crash is ignored when reading, and cut off
+      when the log is opened again for appending
+    - a resumed run first drops the records after its checkpoint (see
+      RunLog.truncate_after()), so generations never go backwards in a log
+"""
+
+import bisect
+import mmap
+import os
+import struct
+from PIL import Image
+from version_2 import genome_format
+from version_2.genome_format import encode_varint, decode_varint
+from version_2.image_renderer import ImageRenderer
+from version_2.pyramid import rescale
+
+MAGIC = b"PERL"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+class RunLog:
+    """
+    Appends elite improvements to a run log file.
+    """
+
+    def __init__(self, path="./polyevolve_run.log"):
+        """
+        Args:
+            path (str): The log file. An existing log is appended to, after
+                its last complete record.
+        """
+        self.path = path
+        self.num_records = 0
+
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self.file = open(path, "r+b")
+        data = self.file.read()
+        if len(data) < len(HEADER) and HEADER.startswith(data): # new, or cut short in the header
+            self.file.seek(0)
+            self.file.write(HEADER)
+            self.file.truncate()
+            self.file.flush()
+            self.records, self.generations = [], []
+        else:
+            if data[:len(HEADER)] != HEADER:
+                self.file.close()
+                raise ValueError(f"Not a version {VERSION} run log: {path}")
+            self.records, self.generations = scan(data)
+            self.cut(self.end())
+
+    def end(self, count=None):
+        """
+        Offset just past the first count records (all of them if None).
+        """
+        records = self.records if count is None else self.records[:count]
+        if not records:
+            return len(HEADER)
+        offset, length = records[-1]
+        return offset + length
+
+    def cut(self, offset):
+        """
+        Truncates the file at an offset and appends from there.
+        """
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        self.file.flush()
+
+    def truncate_after(self, generation):
+        """
+        Drops the records of generations after the given one, e.g. those a
+        run wrote after the checkpoint it is resumed from.
+        """
+        count = bisect.bisect_right(self.generations, generation)
+        if count < len(self.records):
+            self.cut(self.end(count))
+            del self.records[count:], self.generations[count:]
+
+    def append(self, generation, individual):
+        """
+        Writes one record.
+
+        Args:
+            generation (int): Generation the individual became the elite in.
+            individual (Individual): The new elite.
+        """
+        width, height = individual.size
+        payload = (encode_varint(generation) + struct.pack("<d", individual.fitness) +
+                   encode_varint(width) + encode_varint(height) + genome_format.encode(individual))
+        offset = self.end()
+        self.file.write(struct.pack("<I", len(payload)) + payload)
+        self.file.flush() # a record reaches the OS as soon as it is written
+        self.records.append((offset + 4, len(payload)))
+        self.generations.append(generation)
+        self.num_records += 1
+
+    def close(self):
+        self.file.close()
+
+class RunLogReader:
+    """
+    Reads a run log through a memory map.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The log file.
+        """
+        self.file = open(path, "rb")
+        if os.fstat(self.file.fileno()).st_size == 0: # created, header not written yet; mmap cannot map it
+            self.map = b""
+            self.records, self.generations = [], []
+            return
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(HEADER)] != HEADER:
+            self.close()
+            raise ValueError(f"Not a version {VERSION} run log: {path}")
+        self.records, self.generations = scan(self.map)
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, index):
+        """
+        Decodes one record.
+
+        Returns:
+            (tuple): (generation, fitness, Individual).
+        """
+        offset, length = self.records[index]
+        data = memoryview(self.map)[offset:offset + length]
+
+        generation, position = decode_varint(data, 0)
+        (fitness,) = struct.unpack_from("<d", data, position)
+        width, position = decode_varint(data, position + 8)
+        height, position = decode_varint(data, position)
+
+        individual = genome_format.decode(data[position:], (width, height))
+        individual.set_fitness(fitness)
+        return generation, fitness, individual
+
+    def elite_at(self, generation):
+        """
+        The elite as it was after a generation: the last record at or before it.
+
+        Returns:
+            (Individual): The elite, or None if the log starts later.
+        """
+        index = bisect.bisect_right(self.generations, generation) - 1
+        if index < 0:
+            return None
+        return self.record(index)[2]
+
+    def render(self, index, size=None, backend="pillow"):
+        """
+        Renders a record's individual, optionally rescaled to another size.
+
+        Args:
+            index (int): The record.
+            size (tuple): (width, height) to render at, the run's size if None.
+            backend (str): The rendering backend, "pillow" or "inplace".
+
+        Returns:
+            (Image): The rendered image.
+        """
+        individual = self.record(index)[2]
+        if size is not None and tuple(size) != tuple(individual.size):
+            individual = rescale(individual, size)
+        return Image.fromarray(ImageRenderer(backend=backend).render_array(individual), "RGB")
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+def scan(data):
+    """
+    Indexes the complete records of a log, stopping at one cut short.
+
+    Args:
+        data (buffer): The whole file, header included.
+
+    Returns:
+        (tuple): The (offset, length) of every record's payload, and its generation.
+    """
+    records = []
+    generations = []
+    offset = len(HEADER)
+    while offset + 4 <= len(data):
+        (length,) = struct.unpack_from("<I", data, offset)
+        if offset + 4 + length > len(data):
+            break # cut short
+        records.append((offset + 4, length))
+        generations.append(decode_varint(data, offset + 4)[0])
+        offset += 4 + length
+    return records, generations
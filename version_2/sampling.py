@@ -0,0 +1,66 @@
+"""
+sampling.py
+
+A FitnessSample chooses the part of the target that sampled fitness is
+measured on: a random subset of pixels, or a random subset of rows.
+
+Candidates are scored on the sample only; the few that beat the elite
+there are confirmed at full resolution before they can replace it (see
+SampledEvaluator in evaluator.py).
+
+NOTES:
+    - "pixels" saves the diff but still renders every candidate in full
+    - "rows" with the inplace backend draws only from the first to the last
+      sampled row and converts just the sampled ones (exactly as a full
+      render draws them, see rasterizer.render_rows()); with pillow,
+      candidates are still rendered in full
+"""
+
+import numpy as np
+
+MODES = ("pixels", "rows")
+
+class FitnessSample:
+    """
+    Settings for sampled fitness, and the random draws of samples.
+    """
+
+    def __init__(self, fraction=.1, mode="rows", refresh=1, audit_every=0, seed=None):
+        """
+        Args:
+            fraction (float): Fraction of the pixels (or rows) in the sample.
+            mode (str): "pixels" or "rows".
+            refresh (int): Generations between new samples, 0 to keep the first one.
+            audit_every (int): Generations between audits, which also score every
+                candidate in full to measure how often the sample ranks them differently.
+                0 disables audits.
+            seed (int): Seed for drawing samples. If None, a GeneticAlgorithm
+                given this sample draws it from the run's own generator, so the
+                run's seed fixes the samples too.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown sample mode: {mode}")
+        if not 0 < fraction <= 1:
+            raise ValueError("The sample fraction must be in (0, 1]")
+
+        self.fraction = fraction
+        self.mode = mode
+        self.refresh = refresh
+        self.audit_every = audit_every
+        self.seed = seed
+        self.rng = np.random.default_rng(seed) if seed is not None else None # set by the GeneticAlgorithm otherwise
+
+    def draw(self, size):
+        """
+        Draws a new sample of a (width, height) image.
+
+        Returns:
+            (ndarray): Sorted flat pixel indices for "pixels", or sorted row
+            indices for "rows".
+        """
+        if self.rng is None:
+            raise ValueError("The sample has no generator: give it a seed, or a GeneticAlgorithm to run in")
+        width, height = size
+        population = width * height if self.mode == "pixels" else height
+        count = max(1, round(population * self.fraction))
+        return np.sort(self.rng.choice(population, count, replace=False))
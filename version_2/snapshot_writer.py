@@ -0,0 +1,104 @@
+"""
+snapshot_writer.py
+
+Writes images of the elite during a run on a background thread, so that
+image encoding does not hold up evolution.
+
+Write policies:
+    - "every":    every `every` generations
+    - "improved": only when the elite improved
+    - "interval": at most one every `min_interval` seconds
+    - "none":     never
+
+NOTES:
+    - the queue is bounded; if the writer falls behind, submit() blocks
+      instead of holding an unbounded number of frames in memory
+    - the thread and error handling are BackgroundWriter's
+      (background_writer.py): a failed write is raised from the next
+      submit() or close()
+"""
+
+import os
+import time
+import numpy as np
+from PIL import Image
+from version_2.background_writer import BackgroundWriter
+
+POLICIES = ("every", "improved", "interval", "none")
+FORMATS = ("png", "npy")
+
+class SnapshotWriter(BackgroundWriter):
+    """
+    Writes elite snapshots from a bounded queue on a background thread.
+    """
+
+    name = "snapshot-writer"
+
+    def __init__(self, directory="./polyevolve_images", policy="every", every=1, min_interval=0.0,
+                 image_format="png", compress_level=1, queue_size=8):
+        """
+        Args:
+            directory (str): Where snapshots are written (created if missing).
+            policy (str): When to write, see the module notes.
+            every (int): Generations between snapshots for the "every" policy.
+            min_interval (float): Minimum seconds between snapshots for the "interval" policy.
+            image_format (str): "png", or "npy" for raw arrays (no encoding cost).
+            compress_level (int): PNG compression, 0 (none) to 9 (smallest, slowest).
+            queue_size (int): Snapshots that may wait to be written.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown snapshot policy: {policy}")
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown snapshot format: {image_format}")
+
+        self.directory = directory
+        self.policy = policy
+        self.every = every
+        self.min_interval = min_interval
+        self.image_format = image_format
+        self.compress_level = compress_level
+        self.last_write_time = None
+        super().__init__(queue_size)
+
+    def wants(self, generation, improved):
+        """
+        Whether the policy calls for a snapshot of this generation.
+
+        Args:
+            generation (int): Generation number (starting at 1).
+            improved (bool): Whether the elite improved this generation.
+        """
+        if self.policy == "every":
+            return generation % self.every == 0
+        if self.policy == "improved":
+            return improved
+        if self.policy == "interval":
+            now = time.monotonic()
+            return self.last_write_time is None or now - self.last_write_time >= self.min_interval
+        return False
+
+    def submit(self, generation, pixels):
+        """
+        Queues a snapshot. The array must not be modified afterwards.
+
+        Args:
+            generation (int): Generation number, used in the file name.
+            pixels (ndarray): A (height, width, 3) uint8 image of the elite.
+        """
+        if self.thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+        self.start()
+        self.last_write_time = time.monotonic()
+        self.put((generation, pixels))
+        self.raise_error()
+
+    def write(self, item):
+        """
+        Writes one (generation, pixels) snapshot to disk.
+        """
+        generation, pixels = item
+        path = os.path.join(self.directory, f"gen{generation}.{self.image_format}")
+        if self.image_format == "npy":
+            np.save(path, pixels)
+        else:
+            Image.fromarray(pixels, "RGB").save(path, compress_level=self.compress_level)
@@ -0,0 +1,170 @@
+"""
+stats.py
+
+A StatsHistory holds the fitness statistics and timing of a run, one row
+per generation, in a typed NumPy record array. genetic_algorithm.py
+appends a row as each generation finishes, so plotting and analysis read
+whole columns instead of looping over Individuals or per-generation objects.
+
+Columns (see DTYPE):
+    generation                  generation number (starting at 1)
+    min/max/mean/std_fitness    fitness over the generation's candidates, leaving
+                                out those early exit rejected (NaN if all were)
+    elite_fitness               fitness of the elite after the generation
+    elite_vertices              vertices in the elite's genome
+    wall_time                   seconds the generation took
+    width, height               resolution the generation was evaluated at
+    mean_bands                  bands scored per candidate with early exit, NaN otherwise
+    sampled                     whether min/max/mean/std_fitness were scored on a
+                                FitnessSample; elite_fitness is always scored in
+                                full, so the two are then different quantities
+
+NOTES:
+    - stats[i] is a row (np.record) with the columns as attributes, stats.array
+      (or stats.column(name)) the whole table
+    - storage grows by doubling, so appending is amortized O(1)
+"""
+
+import numpy as np
+
+DTYPE = np.dtype([
+    ("generation", np.int64),
+    ("min_fitness", np.float64),
+    ("max_fitness", np.float64),
+    ("mean_fitness", np.float64),
+    ("std_fitness", np.float64),
+    ("elite_fitness", np.float64),
+    ("elite_vertices", np.int32),
+    ("wall_time", np.float64),
+    ("width", np.int32),
+    ("height", np.int32),
+    ("mean_bands", np.float64),
+    ("sampled", np.bool_),
+])
+
+class StatsHistory:
+    """
+    Represents the per-generation statistics of a run as a growing record array.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Args:
+            capacity (int): Rows allocated up front.
+        """
+        self.data = np.recarray(max(1, capacity), dtype=DTYPE)
+        self.length = 0
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Builds a history from rows with the DTYPE columns (e.g. a saved .array).
+        """
+        history = cls(len(array))
+        history.extend(array)
+        return history
+
+    @property
+    def array(self):
+        """
+        The rows so far, as a record array view (columns as attributes).
+        """
+        return self.data[:self.length]
+
+    def column(self, name):
+        """
+        One column of the rows so far.
+        """
+        return self.data[name][:self.length]
+
+    def reserve(self, count):
+        """
+        Makes room for count more rows.
+        """
+        needed = self.length + count
+        if needed > len(self.data):
+            data = np.recarray(max(needed, 2 * len(self.data)), dtype=DTYPE)
+            data[:self.length] = self.data[:self.length]
+            self.data = data
+
+    def append(self, generation, fitnesses, elite, wall_time, resolution=None, band_counts=None, sampled=False):
+        """
+        Records one generation.
+
+        Args:
+            generation (int): Generation number (starting at 1).
+            fitnesses (list): Fitness score of every individual in the generation.
+            elite (Individual): The elite after the generation.
+            wall_time (float): Seconds the generation took.
+            resolution (tuple): (width, height) the generation was evaluated at.
+            band_counts (list): Bands scored per candidate, with early exit.
+            sampled (bool): Whether fitnesses were scored on a FitnessSample.
+        """
+        fitnesses = np.asarray(fitnesses, dtype=np.float64)
+        fitnesses = fitnesses[np.isfinite(fitnesses)] # early exit rejects candidates with -inf (evaluator.REJECTED)
+        width, height = resolution if resolution else elite.size
+
+        self.reserve(1)
+        row = self.data[self.length]
+        row.generation = generation
+        if len(fitnesses):
+            row.min_fitness = fitnesses.min()
+            row.max_fitness = fitnesses.max()
+            row.mean_fitness = fitnesses.mean()
+            row.std_fitness = fitnesses.std()
+        else:
+            row.min_fitness = row.max_fitness = row.mean_fitness = row.std_fitness = np.nan
+        row.elite_fitness = elite.fitness
+        row.elite_vertices = sum(len(gene.vertices) for gene in elite.genome)
+        row.wall_time = wall_time
+        row.width = width
+        row.height = height
+        row.mean_bands = np.mean(band_counts) if band_counts else np.nan
+        row.sampled = sampled
+        self.length += 1
+
+    def extend(self, rows):
+        """
+        Appends rows with the DTYPE columns (another history's array or a slice of it).
+        Rows saved before a column was added get NaN (or False, or 0) for it.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype != DTYPE:
+            filled = np.zeros(len(rows), dtype=DTYPE)
+            for name in DTYPE.names:
+                if name in rows.dtype.names:
+                    filled[name] = rows[name]
+                elif DTYPE[name].kind == "f":
+                    filled[name] = np.nan
+            rows = filled
+        self.reserve(len(rows))
+        self.data[self.length:self.length + len(rows)] = rows
+        self.length += len(rows)
+
+    def decimate(self, max_points):
+        """
+        Evenly spaced rows, at most max_points of them, always keeping the
+        first and the last. For plotting very long runs.
+
+        Returns:
+            (recarray): The selected rows.
+        """
+        if max_points is None or self.length <= max_points:
+            return self.array
+        indices = np.unique(np.linspace(0, self.length - 1, max(2, max_points)).round().astype(np.int64))
+        return self.array[indices]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __repr__(self):
+        if not self.length:
+            return "StatsHistory(0 generations)"
+        return (f"StatsHistory({self.length} generations, "
+                f"elite={self.data.elite_fitness[self.length - 1]:.2f})")
@@ -0,0 +1,69 @@
+"""
+target.py
+
+A Target is the image to be approximated, prepared once when the genetic
+algorithm is created. Every fitness metric reads from these arrays instead
+of reconverting the Pillow image for each candidate.
+
+NOTES:
+    - only the RGB color space is supported for now
+"""
+
+import numpy as np
+
+class Target:
+    """
+    Represents the target image as contiguous, read-only NumPy arrays.
+    """
+
+    def __init__(self, image, dtype=np.int32, color_space="RGB"):
+        """
+        Args:
+            image (Image): The Pillow image to be approximated.
+            dtype (type): NumPy dtype the pixel array is stored in.
+            color_space (str): Color space the pixel array is stored in.
+        """
+        self.image = image
+        rgba = np.asarray(image.convert("RGBA"))
+        self.prepare(rgba[:, :, :3], dtype, color_space)
+
+    @classmethod
+    def from_pixels(cls, pixels, dtype=np.int32, color_space="RGB", planes=None):
+        """
+        Builds a Target from an existing (height, width, 3) array, without
+        copying it if it already has the requested dtype (e.g. an array in
+        shared memory).
+
+        Args:
+            planes (ndarray): The same pixels as a contiguous (3, height, width)
+                array of that dtype, used as is instead of a new planar copy.
+        """
+        target = cls.__new__(cls)
+        target.image = None
+        target.prepare(pixels, dtype, color_space, planes)
+        return target
+
+    def prepare(self, pixels, dtype, color_space, planes=None):
+        """
+        Stores the pixels and everything derived from them.
+        """
+        if color_space != "RGB":
+            raise ValueError(f"Unknown color space: {color_space}")
+
+        self.size = (pixels.shape[1], pixels.shape[0]) # (width, height), as Pillow reports it
+        self.dtype = np.dtype(dtype)
+        self.color_space = color_space
+        self.num_pixels = self.size[0] * self.size[1]
+
+        self.pixels = self.freeze(pixels.astype(self.dtype, copy=False))
+        if planes is None or planes.dtype != self.dtype:
+            planes = self.pixels.transpose(2, 0, 1)
+        self.planes = self.freeze(planes) # (3, height, width), color_solver.py's layout
+
+    def freeze(self, array):
+        """
+        Makes an array contiguous and read-only so it can be shared safely.
+        """
+        array = np.ascontiguousarray(array)
+        array.flags.writeable = False
+        return array